@@ -1,34 +1,205 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, Form
-from app.services.video_processor import process_video
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.services.video_processor import process_video, task_queue
 from app.services.audio_processor import process_audio
 from app.services.gpt_service import generate_description
 from app.services.keyword_extractor import extract_video_metadata
 from app.core.logging import logger
 from app.core.task_tracker import task_tracker
-from typing import Optional
+from app.core.scratch import cleanup_task_scratch, seal_task_source, task_source_path
+from app.core.downloader import download_to_scratch
+from app.core.result_cache import result_cache, result_cache_key
+from app.core.result_store import analysis_results
+from app.core.executors import run_io
+from app.core.rate_limiter import rate_limiter_stats
+from app.core.job_queue import QueueFullError, job_queue
+from app.core.config import settings
+from python_multipart.multipart import MultipartParser, parse_options_header
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
 import uuid
-import asyncio
-import requests
-import os
 import time
+import asyncio
+import hashlib
+import json
 
-MAX_RETRIES = 3
-RETRY_DELAY = 10
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Largest non-file form field (app_name, file_url) accepted from a multipart request
+MAX_FORM_FIELD_BYTES = 64 * 1024
+# Comment line sent on idle progress streams so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+# How often a progress stream checks the shared store for tasks run by other workers
+SSE_POLL_SECONDS = 1.0
+# Polls without any record of the task before a stream gives up on it (allows for
+# the submitting worker's first batched store write)
+SSE_MAX_UNKNOWN_POLLS = 30
 
 router = APIRouter()
 
-analysis_results = {}
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds UPLOAD_MAX_BYTES."""
+
+async def _stream_upload_form(request: Request, task_id: str) -> Tuple[Dict[str, str], Optional[Dict[str, Any]]]:
+    """
+    Parse a multipart analysis request straight off the request stream.
+
+    The "video" part is written to the task's scratch file as it arrives,
+    hashed and size-checked on the way in, so an upload is written to disk
+    once and an oversized one is cut off as soon as it crosses
+    UPLOAD_MAX_BYTES. Other parts are small form fields kept in memory.
+
+    Args:
+        request (Request): Incoming multipart/form-data request
+        task_id (str): Task whose scratch area receives the video
+
+    Returns:
+        Tuple[Dict[str, str], Optional[Dict[str, Any]]]: Form fields, and the
+        uploaded video's path, filename, sha256 and size (None without a video part)
+
+    Raises:
+        UploadTooLargeError: If the video exceeds UPLOAD_MAX_BYTES
+        ValueError: If the body is not usable multipart form data
+    """
+    max_bytes = settings.UPLOAD_MAX_BYTES
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > max_bytes + MAX_FORM_FIELD_BYTES:
+        raise UploadTooLargeError(f"Video is larger than the {max_bytes} byte limit")
+    _, options = parse_options_header(request.headers.get("content-type"))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise ValueError("Missing multipart boundary")
+
+    # The parser reports parts through synchronous callbacks; they are queued
+    # here and handled between writes so file I/O can be awaited
+    events = []
+    headers = {}
+    header_field = bytearray()
+    header_value = bytearray()
+
+    def on_header_end():
+        headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+        filename = disposition.get(b"filename")
+        events.append(("part", (disposition.get(b"name", b"").decode(), filename.decode() if filename is not None else None)))
+        headers.clear()
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": lambda data, start, end: header_field.extend(data[start:end]),
+        "on_header_value": lambda data, start, end: header_value.extend(data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    })
+
+    fields: Dict[str, str] = {}
+    video = None
+    f = None
+    digest = hashlib.sha256()
+    pending = bytearray()
+    part_name = None
+    is_file = False
+    value = bytearray()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, data in events:
+                if kind == "part":
+                    part_name, filename = data
+                    is_file = filename is not None
+                    value.clear()
+                    if part_name == "video" and is_file and video is None:
+                        source_path = await run_io(task_source_path, task_id, min(content_length, max_bytes) or max_bytes)
+                        f = await run_io(open, source_path, 'wb')
+                        video = {"path": source_path, "filename": filename, "size": 0}
+                elif kind == "data":
+                    if f is not None:
+                        video["size"] += len(data)
+                        if video["size"] > max_bytes:
+                            raise UploadTooLargeError(f"Video is larger than the {max_bytes} byte limit")
+                        digest.update(data)
+                        pending.extend(data)
+                        if len(pending) >= UPLOAD_CHUNK_SIZE:
+                            await run_io(f.write, bytes(pending))
+                            pending.clear()
+                    elif not is_file:
+                        value.extend(data)
+                        if len(value) > MAX_FORM_FIELD_BYTES:
+                            raise ValueError(f"Form field {part_name} is too large")
+                elif kind == "end":
+                    if f is not None:
+                        await run_io(f.write, bytes(pending))
+                        pending.clear()
+                        await run_io(f.close)
+                        f = None
+                        await run_io(seal_task_source, video["path"])
+                        video["sha256"] = digest.hexdigest()
+                    elif not is_file:
+                        fields[part_name] = value.decode(errors="replace")
+            events.clear()
+        parser.finalize()
+    finally:
+        if f is not None:
+            await run_io(f.close)
+    if video is not None and "sha256" not in video:
+        raise ValueError("Upload ended before the video part was complete")
+    return fields, video
+
+async def _serve_cached_result(cache_key: str, task_id: str) -> bool:
+    """Complete task_id from the result cache if the video was analysed before."""
+    if not settings.RESULT_CACHE_ENABLED:
+        return False
+    cached = await run_io(result_cache.get, cache_key)
+    if cached is None:
+        return False
+    logger.info(f"Result cache hit for task {task_id} ({cache_key})")
+    task_tracker.start_task(task_id)
+    task_tracker.record_metric(task_id, "result_cache_hit", True)
+    await analysis_results.put(task_id, cached)
+    task_tracker.complete_task(task_id)
+    return True
+
+async def _fail_task(task_id: str, message: str):
+    """Record an error result and mark the task as failed."""
+    await analysis_results.put(task_id, {"status": "error", "message": message})
+    task_tracker.complete_task(task_id, "error")
+
+async def analyze_video_task(video_path: str, task_id: str, app_name: str, cache_key: str = None):
+    """Analyse an upload already spooled to the task's scratch area."""
+    task_tracker.start_task(task_id)
+    await _run_analysis(video_path, task_id, app_name, cache_key)
 
-async def analyze_video_task(video_content: bytes, video_filename: str, task_id: str, app_name: str):
-    audio_result = None
+async def download_and_analyze_task(file_url: str, task_id: str, app_name: str):
+    """Download a video URL into the task's scratch area, then analyse it (or serve it from cache)."""
+    task_tracker.start_task(task_id)
+    task_tracker.update_progress(task_id, "Downloading video", 0)
+    try:
+        video_path, video_sha256 = await download_to_scratch(task_id, file_url)
+    except Exception as e:
+        logger.error(f"Failed to download video for task {task_id}: {str(e)}")
+        await _fail_task(task_id, str(e))
+        cleanup_task_scratch(task_id)
+        return
+    task_tracker.update_progress(task_id, "Video downloaded", 0)
+
+    cache_key = result_cache_key(video_sha256)
+    if await _serve_cached_result(cache_key, task_id):
+        cleanup_task_scratch(task_id)
+        return
+    await _run_analysis(video_path, task_id, app_name, cache_key)
+
+async def _run_analysis(video_path: str, task_id: str, app_name: str, cache_key: str = None):
+    """Run the full pipeline on the task's scratch copy of the video and store the result."""
     try:
-        task_tracker.start_task(task_id)
         current_progress = 0
-        
+
         # Run process_video and process_audio in parallel
         task_tracker.update_progress(task_id, "Starting parallel processing", current_progress)
-        video_task = asyncio.create_task(process_video(video_content, task_id))
-        audio_task = asyncio.create_task(process_audio(video_content, task_id))
+        video_task = asyncio.create_task(process_video(video_path, task_id))
+        audio_task = asyncio.create_task(process_audio(video_path, task_id))
         
         # Wait for both tasks to complete and handle their results
         video_result, audio_result = await asyncio.gather(video_task, audio_task)
@@ -36,19 +207,19 @@ async def analyze_video_task(video_content: bytes, video_filename: str, task_id:
         task_tracker.update_progress(task_id, "Parallel processing completed", current_progress)
         
         # Unpack video processing results
-        is_safe, content_warnings, base64_grids, duration = video_result
+        is_safe, content_warnings, base64_grids, duration, grid_groups, video_failed = video_result
         current_progress = 30
         task_tracker.update_progress(task_id, "Video processing results unpacked", current_progress)
 
-        audio_result, audio_filename = audio_result
-
         # Extract audio transcription from audio result
         audio_transcription = ''
+        audio_failed = True
         try:
             if isinstance(audio_result, (list, tuple)) and audio_result:
                 first_result = audio_result[0]
                 if isinstance(first_result, dict):
                     audio_transcription = first_result.get('text', '')
+                    audio_failed = bool(first_result.get('error') or first_result.get('failed_chunks'))
                 elif hasattr(first_result, 'text'):
                     audio_transcription = first_result.text
         except Exception as e:
@@ -61,22 +232,23 @@ async def analyze_video_task(video_content: bytes, video_filename: str, task_id:
         # Skip further processing if no valid frames were extracted
         if not base64_grids:
             logger.warning("No valid frames were extracted from the video")
-            task_tracker.complete_task(task_id, "error")
-            analysis_results[task_id] = {
+            await analysis_results.put(task_id, {
                 "status": "error",
                 "message": "No valid frames could be extracted from the video"
-            }
+            })
+            task_tracker.complete_task(task_id, "error")
             return
     
         # Generate comprehensive description
         task_tracker.update_progress(task_id, "Generating description", current_progress)
-        description = await generate_description(base64_grids, audio_transcription, task_id)
+        description, description_failed = await generate_description(base64_grids, audio_transcription, task_id, grid_groups)
         current_progress = 60
         task_tracker.update_progress(task_id, "Description generated", current_progress)
         
         # Extract metadata
         task_tracker.update_progress(task_id, "Extracting metadata", current_progress)
         metadata = await extract_video_metadata(description, task_id, duration,is_safe)
+        metadata_failed = not metadata
         metadata["duration_estimate"] = duration
         is_safe = metadata.get("is_safe", is_safe)
         current_progress = 80
@@ -141,7 +313,12 @@ async def analyze_video_task(video_content: bytes, video_filename: str, task_id:
         
         print(f"\n{'#'*30}\nResult: {result}\n{'#'*30}")
         
-        analysis_results[task_id] = result
+        await analysis_results.put(task_id, result)
+        # Only cache analyses whose model calls all succeeded; a transient failure must not be replayed
+        if video_failed or audio_failed or description_failed or metadata_failed:
+            logger.warning(f"Not caching result for task {task_id}: a processing stage failed")
+        elif cache_key and settings.RESULT_CACHE_ENABLED:
+            await run_io(result_cache.put, cache_key, result)
         current_progress = 90
         task_tracker.update_progress(task_id, "Results compiled", current_progress)    
         
@@ -151,67 +328,108 @@ async def analyze_video_task(video_content: bytes, video_filename: str, task_id:
 
     except Exception as e:
         logger.error(f"Error during video analysis: {str(e)}")
-        task_tracker.complete_task(task_id, "error")
-        analysis_results[task_id] = {"status": "error", "message": str(e)}
+        await _fail_task(task_id, str(e))
     finally:
-        # Clean up any remaining audio files if task status is either error or completed
-        task_data = task_tracker.tasks.get(task_id, {})
-        task_status = task_data.get("status")
-        
-        if task_status in ["error", "completed"]:
-            if audio_result and isinstance(audio_result, tuple) and len(audio_result) > 1:
-                audio_filename = audio_result[1]
-                if audio_filename and os.path.exists(audio_filename):
-                    try:
-                        os.unlink(audio_filename)
-                        logger.info(f"Cleaned up audio file: {audio_filename} (Task status: {task_status})")
-                    except Exception as e:
-                        logger.error(f"Error cleaning up audio file: {str(e)}")
-                else:
-                    logger.info(f"No audio file to clean up for task {task_id} (Task status: {task_status})")
-        else:
-            logger.info(f"Skipping audio cleanup for task {task_id} (Task status: {task_status})")
+        # The source video and audio chunks all live in the task's scratch area
+        cleanup_task_scratch(task_id)
+
+def _queue_full_response() -> JSONResponse:
+    """429 telling the client when a queue slot is likely to be free."""
+    retry_after = job_queue.retry_after()
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Too many videos are being analysed, please retry later", "retry_after_seconds": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def _record_queue_positions():
+    """Write every waiting task's queue position and wait estimate to the shared task store."""
+    for position, waiting_id in enumerate(job_queue.waiting(), 1):
+        task_tracker.queue_task(waiting_id, position, job_queue.estimated_wait(position))
+
+def _enqueue(task_id: str, job: Callable[[], Awaitable]) -> Optional[JSONResponse]:
+    """Queue a task's job, returning a 429 response if the queue is full."""
+    async def run():
+        # The tasks behind this one have each moved up a place
+        _record_queue_positions()
+        await job()
+
+    try:
+        job_queue.submit(task_id, run)
+    except QueueFullError as e:
+        logger.warning(f"Rejected task {task_id}: {str(e)}")
+        return _queue_full_response()
+    _record_queue_positions()
+    return None
 
 @router.post("/analyze_video")
-async def analyze_video(
-    background_tasks: BackgroundTasks,
-    app_name: str = Form(...),
-    video: UploadFile = File(None),
-    file_url: Optional[str] = Form(None),
-):
+async def analyze_video(request: Request):
+    """
+    Start an analysis from a multipart form with app_name and either a video
+    file or a file_url.
+
+    The form is parsed by _stream_upload_form rather than FastAPI's Form and
+    File parameters, which would spool the whole body to a temporary file
+    before this handler runs.
+    """
     try:
+        # Reject before downloading or reading anything when there is no room
+        if job_queue.full():
+            return _queue_full_response()
+
+        task_id = str(uuid.uuid4())
+        video = None
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            try:
+                fields, video = await _stream_upload_form(request, task_id)
+            except UploadTooLargeError as e:
+                cleanup_task_scratch(task_id)
+                return JSONResponse(status_code=413, content={"error": str(e)})
+            except Exception:
+                cleanup_task_scratch(task_id)
+                raise
+        else:
+            form = await request.form()
+            fields = {key: value for key, value in form.items() if isinstance(value, str)}
+        app_name = fields.get("app_name")
+        file_url = fields.get("file_url") or None
+
         # Validate input
+        if not app_name:
+            cleanup_task_scratch(task_id)
+            return JSONResponse(status_code=422, content={"error": "app_name is required"})
         if not video and not file_url:
             return {"error": "Either video file or file_url must be provided"}
-        
-        task_id = str(uuid.uuid4())
-        logger.info(f"🎬 Received Task ID: {task_id}, app_name={app_name}, file_url={file_url}, video={video.filename if video else None}")
+
+        logger.info(f"🎬 Received Task ID: {task_id}, app_name={app_name}, file_url={file_url}, video={video['filename'] if video else None}")
 
         if file_url:
-            for attempt in range(MAX_RETRIES):
-                try:
-                    response = requests.get(file_url, timeout=30)
-                    response.raise_for_status()
-                    file_content = response.content
-                    filename = os.path.basename(file_url) or "video_from_url"
-                    background_tasks.add_task(analyze_video_task, file_content, filename, task_id, app_name)
-                    break
-                except requests.RequestException as e:
-                    if attempt == MAX_RETRIES - 1:
-                        logger.error(f"Failed to download video after {MAX_RETRIES} attempts: {str(e)}")
-                        return {"error": f"Failed to download video: {str(e)}"}
-                    print(f"Attempt {attempt + 1}: Failed to download. Retrying in {RETRY_DELAY} seconds...")
-                    time.sleep(RETRY_DELAY)
+            if video:
+                # An uploaded file alongside a URL is ignored, as before
+                cleanup_task_scratch(task_id)
+            # Downloaded in the background by the job, so a slow origin never blocks the request
+            rejected = _enqueue(task_id, lambda: download_and_analyze_task(file_url, task_id, app_name))
+            if rejected:
+                return rejected
         
         elif video:
-            if video.size == 0:
+            if not video["size"]:
+                cleanup_task_scratch(task_id)
                 return {"error": "Uploaded file is empty"}
-            video_content = await video.read()
-            background_tasks.add_task(analyze_video_task, video_content, video.filename, task_id, app_name)
+            video_path = video["path"]
+            cache_key = result_cache_key(video["sha256"])
+            if await _serve_cached_result(cache_key, task_id):
+                cleanup_task_scratch(task_id)
+                return {"message": "Video analysis completed from cache.", "task_id": task_id, "cached": True}
+            rejected = _enqueue(task_id, lambda: analyze_video_task(video_path, task_id, app_name, cache_key))
+            if rejected:
+                cleanup_task_scratch(task_id)
+                return rejected
 
         return {
             "message": "Video analysis started.",
-            "task_id": task_id
+            "task_id": task_id,
+            "queue_position": job_queue.position(task_id)
         }
     
     except Exception as e:
@@ -220,15 +438,142 @@ async def analyze_video(
 
 @router.get("/analysis_result/{task_id}")
 async def get_analysis_result(task_id: str):
-    result = analysis_results.get(task_id)
+    result = await analysis_results.get(task_id)
     if result is None:
-        # Get progress from task tracker
-        task_data = task_tracker.tasks.get(task_id)
+        position = job_queue.position(task_id)
+        if position is not None:
+            return {
+                "status": "pending",
+                "progress": 0,
+                "current_step": "Queued",
+                "queue_position": position,
+                "estimated_wait_seconds": round(job_queue.estimated_wait(position)),
+            }
+        # Get progress from task tracker (shared with the other workers)
+        task_data = await run_io(task_tracker.get_task, task_id)
+        if task_data and task_data.get("status") == "queued":
+            # Queued in another worker; its position is as of that worker's last queue change
+            return {
+                "status": "pending",
+                "progress": 0,
+                "current_step": "Queued",
+                "queue_position": task_data["queue_position"],
+                "estimated_wait_seconds": max(0, round(task_data["estimated_start_time"] - time.time())),
+            }
         if task_data:
             return {
                 "status": "pending",
                 "progress": task_data["current_progress"],
-                "current_step": list(task_data["steps"].keys())[-1] if task_data["steps"] else None
+                "current_step": task_data.get("current_step")
             }
         return {"status": "pending", "progress": 0}
-    return result
\ No newline at end of file
+    return result
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _is_finished(task_data: Optional[dict]) -> bool:
+    return bool(task_data) and task_data.get("status") not in (None, "queued", "in_progress")
+
+async def _analysis_events(task_id: str) -> AsyncIterator[str]:
+    """
+    Yield a task's progress as server-sent events, ending with its result.
+
+    Besides progress events, description_delta events carry final
+    description text as it is generated, followed by one description event
+    with the complete text.
+
+    The stream subscribes before reading the current state, so no update
+    between the snapshot and the first live event is lost. Tasks running in
+    another worker publish nothing here, so the shared task store is polled
+    for their progress every SSE_POLL_SECONDS instead (without description
+    deltas). If no worker knows the task after SSE_MAX_UNKNOWN_POLLS polls,
+    the stream ends with an error result.
+    """
+    queue = task_tracker.subscribe(task_id)
+    try:
+        task_data = await run_io(task_tracker.get_task, task_id)
+        result = await analysis_results.get(task_id)
+        if result is not None:
+            yield _sse_event("result", result)
+            return
+        if _is_finished(task_data):
+            # Finished without a stored result (e.g. its archive entry expired)
+            yield _sse_event("result", {"status": task_data["status"]})
+            return
+        last_snapshot = None
+        if task_data:
+            last_snapshot = (task_data.get("current_step"), task_data["current_progress"])
+            yield _sse_event("progress", {"step": last_snapshot[0], "progress": last_snapshot[1]})
+
+        idle_seconds = 0.0
+        unknown_polls = 0
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), SSE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                event = None
+
+            if event is not None:
+                idle_seconds = 0.0
+                if event["event"] == "complete":
+                    result = await analysis_results.get(task_id)
+                    yield _sse_event("result", result if result is not None else {"status": event["status"]})
+                    return
+                if event["event"] == "progress":
+                    last_snapshot = (event["step"], event["progress"])
+                yield _sse_event(event["event"], {key: value for key, value in event.items() if key != "event"})
+                continue
+
+            if task_id not in task_tracker.tasks:
+                task_data = await run_io(task_tracker.get_task, task_id)
+                if _is_finished(task_data):
+                    result = await analysis_results.get(task_id)
+                    yield _sse_event("result", result if result is not None else {"status": task_data["status"]})
+                    return
+                if task_data or job_queue.position(task_id) is not None:
+                    unknown_polls = 0
+                else:
+                    unknown_polls += 1
+                    if unknown_polls >= SSE_MAX_UNKNOWN_POLLS:
+                        yield _sse_event("result", {"status": "error", "message": f"Unknown task {task_id}"})
+                        return
+                if task_data:
+                    snapshot = (task_data.get("current_step"), task_data["current_progress"])
+                    if snapshot != last_snapshot:
+                        last_snapshot = snapshot
+                        idle_seconds = 0.0
+                        yield _sse_event("progress", {"step": snapshot[0], "progress": snapshot[1]})
+                        continue
+
+            idle_seconds += SSE_POLL_SECONDS
+            if idle_seconds >= SSE_KEEPALIVE_SECONDS:
+                idle_seconds = 0.0
+                yield ": keep-alive\n\n"
+    finally:
+        task_tracker.unsubscribe(task_id, queue)
+
+@router.get("/analysis_stream/{task_id}")
+async def stream_analysis(task_id: str):
+    """Stream progress updates and the final result as server-sent events."""
+    return StreamingResponse(
+        _analysis_events(task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/llm_rate_limits")
+async def get_llm_rate_limits():
+    """Queue depth and throttling state of each provider model's rate limiter."""
+    return rate_limiter_stats()
+
+@router.get("/task_state_stats")
+async def get_task_state_stats():
+    """Count and approximate bytes of the task state resident in this process."""
+    return {
+        "tasks": task_tracker.resident_stats(),
+        "analysis_results": analysis_results.stats(),
+        "task_queue": {"entries": len(task_queue)},
+        "job_queue": job_queue.stats(),
+    }
@@ -1,14 +1,135 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Video Description API"
     PROJECT_VERSION: str = "1.0.0"
-    OPENAI_API_KEY: str
-    GEMINI_API_KEY: str
+    OPENAI_API_KEY: str = ""
+    GEMINI_API_KEY: str = ""
     openai_model: bool 
     gemini_model: bool
     omni_moderation_model: bool
 
+    # LLM provider layer: "gemini", "openai" or "fake" (defaults to the model flags above)
+    LLM_PROVIDER: Optional[str] = None
+    GEMINI_MODEL: str = "gemini-2.0-flash"
+    OPENAI_VISION_MODEL: str = "gpt-4o"
+    OPENAI_TEXT_MODEL: str = "gpt-4"
+    OPENAI_TRANSCRIPTION_MODEL: str = "whisper-1"
+    OPENAI_MODERATION_MODEL: str = "omni-moderation-latest"
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    LLM_FAKE_LATENCY_MS: int = 0
+
+    # Per "provider:model" rate limits (0 means unlimited); LLM_RATE_LIMITS overrides
+    # them per key as JSON, e.g. {"gemini:gemini-2.0-flash": [2000, 4000000]}
+    LLM_REQUESTS_PER_MINUTE: int = 0
+    LLM_TOKENS_PER_MINUTE: int = 0
+    LLM_RATE_LIMITS: Dict[str, List[int]] = {}
+    LLM_MAX_RETRIES: int = 5
+    LLM_BACKOFF_BASE_SECONDS: float = 1.0
+    LLM_BACKOFF_MAX_SECONDS: float = 60.0
+
+    # Analysis job queue per worker process: concurrent jobs, waiting jobs before 429,
+    # and the job duration assumed for wait estimates until real ones are measured
+    JOB_WORKERS: int = 2
+    JOB_QUEUE_MAX_DEPTH: int = 20
+    JOB_DEFAULT_SECONDS: float = 120.0
+
+    # Largest accepted multipart upload (spooled to scratch in chunks)
+    UPLOAD_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+
+    # Video URL downloads (streamed to scratch, resumed with Range requests on retry)
+    DOWNLOAD_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    DOWNLOAD_MAX_RETRIES: int = 3
+    DOWNLOAD_TIMEOUT_SECONDS: float = 60.0
+    DOWNLOAD_BACKOFF_BASE_SECONDS: float = 2.0
+    DOWNLOAD_BACKOFF_MAX_SECONDS: float = 30.0
+    DOWNLOAD_MAX_CONNECTIONS: int = 20
+
+    # Per-task scratch area (defaults to /dev/shm when available, else the system temp dir)
+    SCRATCH_DIR: Optional[str] = None
+    SCRATCH_MAX_AGE_SECONDS: int = 6 * 60 * 60
+
+    # TaskTracker persistence, flushed in batches: "sqlite" (WAL, shared by workers on one host),
+    # "redis" (task records and archived results shared across hosts) or "journal"
+    # (append-only JSONL, single worker only)
+    TASK_STORE_BACKEND: str = "sqlite"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    TASK_STORE_FILE: str = "docs/tasks.db"
+    TASK_JOURNAL_FILE: str = "docs/tasks.jsonl"
+    TASK_JOURNAL_COMPACT_FACTOR: int = 4
+    TASK_STORE_FLUSH_INTERVAL_SECONDS: float = 0.5
+
+    # Resident task state: finished tasks stay in memory for the TTL, then are served from disk
+    TASK_STATE_TTL_SECONDS: int = 10 * 60
+    TASK_STATE_MAX_FINISHED: int = 1000
+    RESULT_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024
+    RESULT_ARCHIVE_FILE: str = "docs/results_archive.db"
+    RESULT_ARCHIVE_TTL_SECONDS: int = 30 * 24 * 60 * 60
+    RESULT_ARCHIVE_MAX_BYTES: int = 1024 * 1024 * 1024
+
+    # Executors for blocking work (0 CPU workers means one per core)
+    CPU_WORKERS: int = 0
+    IO_WORKERS: int = 8
+
+    # Grid images: pixel budget (default fits 2x2 768px Gemini tiles at 16:9), format and quality
+    GRID_MAX_PIXELS: int = 1536 * 864
+    GRID_FORMAT: str = "jpeg"
+    GRID_QUALITY: int = 85
+
+    # Keyframe selection: "uniform" (evenly spaced) or "scene" (most distinct of the candidates)
+    FRAME_SELECTION: str = "uniform"
+    SCENE_CANDIDATES_PER_GRID: int = 64
+
+    # Perceptual-hash grid deduplication (largest per-frame dHash Hamming distance, 0-64 bits)
+    GRID_DEDUP_ENABLED: bool = True
+    GRID_DEDUP_HAMMING_THRESHOLD: float = 5.0
+
+    # Content-addressed cache of completed analyses
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_FILE: str = "docs/result_cache.db"
+    RESULT_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Per-call model response cache (in-memory LRU over an on-disk store)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MEMORY_ENTRIES: int = 1024
+    LLM_CACHE_FILE: str = "docs/llm_cache.db"
+    LLM_CACHE_TTL_SECONDS: int = 30 * 24 * 60 * 60
+    LLM_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
+    # Content moderation fan-out
+    MODERATION_CONCURRENCY: int = 5
+    MODERATION_TIMEOUT_SECONDS: float = 60.0
+
+    # Pack images from all concurrent tasks into shared moderation requests
+    MODERATION_BATCHING: bool = False
+    MODERATION_BATCH_MAX_IMAGES: int = 8
+    MODERATION_BATCH_WINDOW_MS: int = 50
+
+    # Transcription chunk encoding (mono 16 kHz): "flac" (lossless) or "opus" (24 kbit/s)
+    AUDIO_CHUNK_FORMAT: str = "flac"
+    # Audio shared by adjacent chunks, and concurrent transcription calls per task
+    AUDIO_CHUNK_OVERLAP_MS: int = 2000
+    TRANSCRIPTION_CONCURRENCY: int = 4
+
+    # Energy/zero-crossing voice activity detection: silent chunks are never transcribed
+    # and the rest are trimmed to their speech span
+    VAD_ENABLED: bool = True
+    VAD_ENERGY_THRESHOLD_DB: float = -40.0
+    VAD_MAX_ZERO_CROSSING_RATE: float = 0.4
+    VAD_MIN_SPEECH_MS: int = 300
+    VAD_PADDING_MS: int = 300
+
+    # Concurrent vision calls per task when describing grids
+    GRID_ANALYSIS_CONCURRENCY: int = 5
+
+    # Stream final description tokens to progress subscribers as they are generated
+    DESCRIPTION_STREAMING: bool = True
+
     class Config:
         env_file = ".env"
 
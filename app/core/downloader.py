@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import random
+from typing import Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.core.executors import run_io
+from app.core.logging import logger
+from app.core.scratch import seal_task_source, task_source_path
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Statuses worth retrying; other 4xx responses fail immediately
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class DownloadError(Exception):
+    """Raised when a video URL cannot be downloaded."""
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared pooled client used for video downloads."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=settings.DOWNLOAD_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT_SECONDS, connect=10.0),
+            follow_redirects=True,
+        )
+    return _client
+
+async def close_download_client():
+    """Close the download connection pool."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def download_to_scratch(task_id: str, url: str) -> Tuple[str, str]:
+    """
+    Stream a video URL into the task's scratch file without blocking the event loop.
+
+    Failed transfers are retried with exponential backoff and jitter, resuming
+    from the last received byte with a Range request when the origin supports
+    it. Downloads over DOWNLOAD_MAX_BYTES are aborted.
+
+    Args:
+        task_id (str): Unique task identifier
+        url (str): Video URL
+
+    Returns:
+        Tuple[str, str]: Read-only path to the downloaded video and its SHA-256
+
+    Raises:
+        DownloadError: If the download fails, is rejected or is too large
+    """
+    max_bytes = settings.DOWNLOAD_MAX_BYTES
+    source_path = None
+    digest = hashlib.sha256()
+    received = 0
+
+    for attempt in range(settings.DOWNLOAD_MAX_RETRIES + 1):
+        headers = {"Range": f"bytes={received}-"} if received else {}
+        try:
+            async with _get_client().stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                if received and response.status_code != 206:
+                    # Origin ignored the range; start the file over
+                    logger.info(f"Origin does not support range requests, restarting download for task {task_id}")
+                    digest = hashlib.sha256()
+                    received = 0
+
+                remaining = response.headers.get("content-length")
+                if remaining and received + int(remaining) > max_bytes:
+                    raise DownloadError(f"Video is larger than the {max_bytes} byte limit")
+                if source_path is None:
+                    source_path = await run_io(task_source_path, task_id, int(remaining) if remaining else max_bytes)
+
+                f = await run_io(open, source_path, 'ab' if received else 'wb')
+                try:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        if received + len(chunk) > max_bytes:
+                            raise DownloadError(f"Video is larger than the {max_bytes} byte limit")
+                        await run_io(f.write, chunk)
+                        digest.update(chunk)
+                        received += len(chunk)
+                finally:
+                    await run_io(f.close)
+
+            if not received:
+                raise DownloadError("Downloaded video is empty")
+            await run_io(seal_task_source, source_path)
+            logger.info(f"Downloaded {received} bytes for task {task_id} to {source_path}")
+            return source_path, digest.hexdigest()
+
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in RETRYABLE_STATUS_CODES or attempt == settings.DOWNLOAD_MAX_RETRIES:
+                raise DownloadError(f"Failed to download video: {str(e)}")
+            error = e
+        except httpx.TransportError as e:
+            if attempt == settings.DOWNLOAD_MAX_RETRIES:
+                raise DownloadError(f"Failed to download video after {attempt + 1} attempts: {str(e)}")
+            error = e
+
+        delay = min(settings.DOWNLOAD_BACKOFF_MAX_SECONDS, settings.DOWNLOAD_BACKOFF_BASE_SECONDS * 2 ** attempt)
+        delay *= random.uniform(0.5, 1.0)
+        logger.warning(f"Attempt {attempt + 1}: failed to download {url} ({str(error)}), retrying in {delay:.1f}s from byte {received}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,50 @@
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool used for decode/encode work."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.CPU_WORKERS or None)
+        logger.info(f"Started process pool with {_process_pool._max_workers} workers")
+    return _process_pool
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Return the shared thread pool used for blocking file I/O."""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=settings.IO_WORKERS, thread_name_prefix="io")
+    return _thread_pool
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run CPU-bound work in the process pool without blocking the event loop.
+
+    func and its arguments must be picklable, so pass module-level functions
+    and plain data (paths, dicts) rather than open handles.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(func, *args, **kwargs))
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """Run blocking I/O in the thread pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_thread_pool(), functools.partial(func, *args, **kwargs))
+
+def shutdown_executors():
+    """Shut down the shared pools, waiting for running work to finish."""
+    global _process_pool, _thread_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=True)
+        _thread_pool = None
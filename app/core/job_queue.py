@@ -0,0 +1,118 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted to a full queue."""
+
+class JobQueue:
+    """
+    Bounded FIFO of analysis jobs run by a fixed pool of worker coroutines.
+
+    At most `workers` jobs run at once and at most `max_depth` wait; beyond
+    that submissions are rejected so callers can answer 429. Recent job
+    durations drive the queue position wait estimates.
+    """
+
+    def __init__(self, workers: int, max_depth: int, default_job_seconds: float):
+        # asyncio.Queue treats maxsize 0 as unbounded, which would disable admission control
+        if max_depth < 1:
+            raise ValueError(f"Job queue max depth must be at least 1, got {max_depth}")
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.default_job_seconds = default_job_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_depth)
+        # Waiting task ids in queue order, for position lookups
+        self._waiting: Dict[str, None] = {}
+        self.running: Dict[str, float] = {}
+        self._durations = deque(maxlen=50)
+        self._worker_tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the worker coroutines on the running event loop."""
+        if self._worker_tasks:
+            return
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started job queue with {self.workers} workers, max depth {self.max_depth}")
+
+    async def stop(self) -> List[str]:
+        """Cancel the workers; queued jobs are dropped and their task ids returned."""
+        for worker in self._worker_tasks:
+            worker.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        dropped = self.waiting()
+        self._waiting.clear()
+        return dropped
+
+    def full(self) -> bool:
+        return self.queue.full()
+
+    def submit(self, task_id: str, job: Callable[[], Awaitable]):
+        """
+        Queue a job for task_id.
+
+        Raises:
+            QueueFullError: If max_depth jobs are already waiting
+        """
+        try:
+            self.queue.put_nowait((task_id, job))
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_depth} waiting)")
+        self._waiting[task_id] = None
+
+    async def _worker(self):
+        while True:
+            task_id, job = await self.queue.get()
+            self._waiting.pop(task_id, None)
+            started = time.monotonic()
+            self.running[task_id] = started
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Job for task {task_id} failed: {str(e)}")
+            finally:
+                self.running.pop(task_id, None)
+                self._durations.append(time.monotonic() - started)
+                self.queue.task_done()
+
+    def average_job_seconds(self) -> float:
+        if not self._durations:
+            return self.default_job_seconds
+        return sum(self._durations) / len(self._durations)
+
+    def waiting(self) -> List[str]:
+        """Ids of the waiting tasks in queue order."""
+        return list(self._waiting)
+
+    def position(self, task_id: str) -> Optional[int]:
+        """1-based position of a waiting task, or None if it is not waiting."""
+        for position, waiting_id in enumerate(self._waiting, 1):
+            if waiting_id == task_id:
+                return position
+        return None
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until the job at position starts, assuming average job times."""
+        return math.ceil(position / self.workers) * self.average_job_seconds()
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait before a slot is likely to free up."""
+        return max(1, math.ceil(self.average_job_seconds() / self.workers))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "running": len(self.running),
+            "waiting": len(self._waiting),
+            "max_depth": self.max_depth,
+            "average_job_seconds": round(self.average_job_seconds(), 1),
+        }
+
+# Global instance
+job_queue = JobQueue(settings.JOB_WORKERS, settings.JOB_QUEUE_MAX_DEPTH, settings.JOB_DEFAULT_SECONDS)
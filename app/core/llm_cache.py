@@ -0,0 +1,91 @@
+import copy
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cachetools import LRUCache
+
+from app.core.config import settings
+from app.core.executors import run_io
+from app.core.logging import logger
+from app.core.result_cache import ResultCache
+
+def llm_cache_key(kind: str, model: str, prompt: str, data: Optional[bytes] = None, config: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build the cache key for one model call.
+
+    Args:
+        kind (str): Call type, e.g. "moderation" or "transcription"
+        model (str): Model name
+        prompt (str): Prompt text
+        data (bytes, optional): Image or audio bytes sent with the prompt
+        config (Dict, optional): Generation config (max tokens, temperature, ...)
+
+    Returns:
+        str: Hex SHA-256 over all inputs
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([kind, model, prompt, config or {}], sort_keys=True).encode())
+    if data:
+        digest.update(hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+class LLMResponseCache:
+    """In-memory LRU of model responses backed by an on-disk store."""
+
+    def __init__(self, memory_entries: int, disk_store: ResultCache):
+        self.memory = LRUCache(maxsize=memory_entries)
+        self.disk = disk_store
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached response for key, checking memory before disk.
+
+        Memory hits are deep-copied so callers can mutate what they get back.
+        """
+        if key in self.memory:
+            return copy.deepcopy(self.memory[key])
+        entry = await run_io(self.disk.get, key)
+        if entry is None:
+            return None
+        self.memory[key] = copy.deepcopy(entry["value"])
+        return entry["value"]
+
+    async def put(self, key: str, value: Any):
+        """Store a JSON-serializable response in memory and on disk."""
+        self.memory[key] = copy.deepcopy(value)
+        await run_io(self.disk.put, key, {"value": value})
+
+llm_cache = LLMResponseCache(
+    settings.LLM_CACHE_MEMORY_ENTRIES,
+    ResultCache(settings.LLM_CACHE_FILE, settings.LLM_CACHE_TTL_SECONDS, settings.LLM_CACHE_MAX_BYTES),
+)
+
+async def cached_llm_call(
+    kind: str,
+    model: str,
+    prompt: str,
+    call: Callable[[], Awaitable[Any]],
+    data: Optional[bytes] = None,
+    config: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Return a memoized model response, making the call only on a cache miss.
+
+    call must return a JSON-serializable value (usually the response text).
+    Failed calls raise and are not cached.
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return await call()
+    key = llm_cache_key(kind, model, prompt, data, config)
+    cached = await llm_cache.get(key)
+    if cached is not None:
+        llm_cache.hits += 1
+        logger.info(f"LLM cache hit for {kind} call ({model})")
+        return cached
+    llm_cache.misses += 1
+    value = await call()
+    await llm_cache.put(key, value)
+    return value
@@ -0,0 +1,185 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# Provider status codes that mean "slow down and try again"
+RETRYABLE_STATUS_CODES = {429, 503}
+# Floor for the adaptive rate multiplier after repeated 429s
+MIN_RATE_SCALE = 0.1
+# Multiplier recovery per successful call
+RATE_SCALE_RECOVERY = 0.05
+
+class TokenBucket:
+    """Bucket refilled continuously at per_minute / 60 units per second."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float, scale: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60 * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float, scale: float) -> float:
+        """Seconds until amount units are available (amount is capped at capacity)."""
+        self._refill(now, scale)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.capacity / 60 * scale)
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter for one provider model.
+
+    Callers are admitted strictly in arrival order. A 429 pauses every caller
+    until the provider's Retry-After has passed and halves the refill rate,
+    which then recovers a little with each successful call.
+    """
+
+    def __init__(self, key: str, requests_per_minute: int, tokens_per_minute: int):
+        self.key = key
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.rate_scale = 1.0
+        self.paused_until = 0.0
+        self.waiting = 0
+        self.throttled = 0
+        self._lock = asyncio.Lock()
+
+    def _wait_time(self, tokens: int) -> float:
+        now = time.monotonic()
+        wait = max(0.0, self.paused_until - now)
+        if self.requests:
+            wait = max(wait, self.requests.wait_time(1, now, self.rate_scale))
+        if self.tokens:
+            wait = max(wait, self.tokens.wait_time(tokens, now, self.rate_scale))
+        return wait
+
+    async def acquire(self, tokens: int = 0):
+        """Wait for this caller's turn and for quota for one request of about tokens tokens."""
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                if self.requests:
+                    self.requests.take(1)
+                if self.tokens:
+                    self.tokens.take(tokens)
+        finally:
+            self.waiting -= 1
+
+    def throttle(self, delay: float):
+        """Pause all callers for delay seconds and slow the refill rate."""
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        self.rate_scale = max(MIN_RATE_SCALE, self.rate_scale / 2)
+
+    def record_success(self):
+        self.rate_scale = min(1.0, self.rate_scale + RATE_SCALE_RECOVERY)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.waiting,
+            "rate_scale": round(self.rate_scale, 3),
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            "throttled": self.throttled,
+            "requests_per_minute": int(self.requests.capacity) if self.requests else None,
+            "tokens_per_minute": int(self.tokens.capacity) if self.tokens else None,
+        }
+
+_limiters: Dict[str, RateLimiter] = {}
+
+def get_rate_limiter(key: str) -> RateLimiter:
+    """
+    Return the process-wide limiter for a "provider:model" key.
+
+    Limits come from LLM_RATE_LIMITS[key] when present, otherwise from
+    LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE (0 means unlimited).
+    """
+    if key not in _limiters:
+        requests_per_minute, tokens_per_minute = settings.LLM_RATE_LIMITS.get(
+            key, [settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE]
+        )
+        _limiters[key] = RateLimiter(key, requests_per_minute, tokens_per_minute)
+    return _limiters[key]
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Return queue depth and throttling state for every limiter in use."""
+    return {key: limiter.stats() for key, limiter in _limiters.items()}
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Extract the HTTP status from an OpenAI or google-genai error."""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Return the Retry-After delay in seconds carried by an error response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+async def call_with_rate_limit(key: str, tokens: int, call: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+    """
+    Make a provider call under its limiter, retrying 429 and 503 responses.
+
+    Args:
+        key (str): "provider:model" limiter key
+        tokens (int): Estimated prompt plus completion tokens for the call
+        call (Callable): Zero-argument coroutine factory making the request
+        timeout (float, optional): Limit for each request attempt; time spent
+            waiting for quota or backing off does not count against it
+
+    Returns:
+        Any: Whatever call returns
+    """
+    limiter = get_rate_limiter(key)
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        await limiter.acquire(tokens)
+        try:
+            result = await (asyncio.wait_for(call(), timeout) if timeout else call())
+        except Exception as e:
+            status = _status_code(e)
+            if status not in RETRYABLE_STATUS_CODES or attempt == settings.LLM_MAX_RETRIES:
+                raise
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = retry_after + random.uniform(0, settings.LLM_BACKOFF_BASE_SECONDS)
+            else:
+                # Full jitter keeps throttled tasks from retrying in lockstep
+                delay = random.uniform(0, min(settings.LLM_BACKOFF_MAX_SECONDS, settings.LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+            if status == 429:
+                limiter.throttle(delay)
+            logger.warning(f"{key} returned {status}, retrying in {delay:.1f}s (attempt {attempt + 1}/{settings.LLM_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+            continue
+        limiter.record_success()
+        return result
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# Settings that change what an analysis returns; any change invalidates cached results
+RESULT_CACHE_KEY_SETTINGS = (
+    "openai_model",
+    "gemini_model",
+    "omni_moderation_model",
+    "LLM_PROVIDER",
+    "GEMINI_MODEL",
+    "OPENAI_VISION_MODEL",
+    "OPENAI_TEXT_MODEL",
+    "OPENAI_TRANSCRIPTION_MODEL",
+    "OPENAI_MODERATION_MODEL",
+    "GRID_MAX_PIXELS",
+    "GRID_FORMAT",
+    "GRID_QUALITY",
+    "FRAME_SELECTION",
+    "SCENE_CANDIDATES_PER_GRID",
+    "GRID_DEDUP_ENABLED",
+    "GRID_DEDUP_HAMMING_THRESHOLD",
+    "AUDIO_CHUNK_FORMAT",
+    "AUDIO_CHUNK_OVERLAP_MS",
+    "VAD_ENABLED",
+    "VAD_ENERGY_THRESHOLD_DB",
+    "VAD_MAX_ZERO_CROSSING_RATE",
+    "VAD_MIN_SPEECH_MS",
+    "VAD_PADDING_MS",
+)
+# Bump when the pipeline changes in a way the settings above do not capture
+RESULT_CACHE_VERSION = 2
+
+def config_fingerprint() -> str:
+    """Return a short hash of the provider/model configuration."""
+    config = {name: getattr(settings, name) for name in RESULT_CACHE_KEY_SETTINGS}
+    config["version"] = RESULT_CACHE_VERSION
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+def result_cache_key(video_sha256: str) -> str:
+    """Build the cache key for a video's content hash under the current configuration."""
+    return f"{video_sha256}:{config_fingerprint()}"
+
+class ResultCache:
+    """Persistent analysis result cache with TTL and size-based LRU eviction."""
+
+    def __init__(self, db_file: str, ttl_seconds: int, max_bytes: int):
+        self.db_file = db_file
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for key, or None if missing or expired."""
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT result, created_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if now - row[1] > self.ttl_seconds:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+                    return None
+                self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Error reading result cache: {str(e)}")
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a result and evict expired or least recently used entries."""
+        payload = json.dumps(result)
+        now = time.time()
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, result, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), now, now),
+                )
+                self._evict(now)
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing result cache: {str(e)}")
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used until under max_bytes."""
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+# Global instance
+result_cache = ResultCache(
+    settings.RESULT_CACHE_FILE,
+    settings.RESULT_CACHE_TTL_SECONDS,
+    settings.RESULT_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,82 @@
+import json
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+from app.core.config import settings
+from app.core.executors import run_io
+from app.core.logging import logger
+from app.core.result_cache import ResultCache
+
+def json_size(value: Any) -> int:
+    """Approximate resident size of a JSON-serializable value in bytes."""
+    return len(json.dumps(value))
+
+class RedisResultArchive:
+    """Result archive in Redis with the same get/put interface as ResultCache."""
+
+    KEY_PREFIX = "video-analysis:result:"
+
+    def __init__(self, url: str, ttl_seconds: int):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload = self.client.get(f"{self.KEY_PREFIX}{key}")
+            return json.loads(payload) if payload else None
+        except Exception as e:
+            logger.error(f"Error reading result archive: {str(e)}")
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        try:
+            self.client.set(f"{self.KEY_PREFIX}{key}", json.dumps(result), ex=self.ttl_seconds)
+        except Exception as e:
+            logger.error(f"Error writing result archive: {str(e)}")
+
+def create_result_archive():
+    """Archive in Redis when TASK_STORE_BACKEND is "redis", else in SQLite."""
+    if settings.TASK_STORE_BACKEND == "redis":
+        return RedisResultArchive(settings.REDIS_URL, settings.RESULT_ARCHIVE_TTL_SECONDS)
+    return ResultCache(settings.RESULT_ARCHIVE_FILE, settings.RESULT_ARCHIVE_TTL_SECONDS, settings.RESULT_ARCHIVE_MAX_BYTES)
+
+class TaskResultStore:
+    """
+    Analysis results by task id: a byte-bounded TTL cache over a disk archive.
+
+    Every result is written through to the archive, so entries evicted from
+    memory (by age or size), or produced by another worker, can still be
+    served from it.
+    """
+
+    def __init__(self, memory_max_bytes: int, memory_ttl_seconds: int, archive):
+        self.memory = TTLCache(maxsize=memory_max_bytes, ttl=memory_ttl_seconds, getsizeof=json_size)
+        self.archive = archive
+
+    async def put(self, task_id: str, result: Dict[str, Any]):
+        """Store a task's result in memory and in the archive."""
+        try:
+            self.memory[task_id] = result
+        except ValueError:
+            logger.warning(f"Result for task {task_id} exceeds the in-memory limit, archiving only")
+        await run_io(self.archive.put, task_id, result)
+
+    async def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return a task's result from memory, falling back to the archive."""
+        result = self.memory.get(task_id)
+        if result is not None:
+            return result
+        return await run_io(self.archive.get, task_id)
+
+    def stats(self) -> Dict[str, int]:
+        self.memory.expire()
+        return {"entries": len(self.memory), "bytes": self.memory.currsize}
+
+# Global instance
+analysis_results = TaskResultStore(
+    settings.RESULT_MEMORY_MAX_BYTES,
+    settings.TASK_STATE_TTL_SECONDS,
+    create_result_archive(),
+)
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import shutil
+import stat
+import tempfile
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+SCRATCH_SUBDIR = "video-analysis"
+SOURCE_FILENAME = "source.mp4"
+TMPFS_ROOT = "/dev/shm"
+
+def _scratch_roots() -> list:
+    """Return the candidate scratch roots, preferred first."""
+    if settings.SCRATCH_DIR:
+        return [os.path.join(settings.SCRATCH_DIR, SCRATCH_SUBDIR)]
+    roots = []
+    if os.path.isdir(TMPFS_ROOT) and os.access(TMPFS_ROOT, os.W_OK):
+        roots.append(os.path.join(TMPFS_ROOT, SCRATCH_SUBDIR))
+    roots.append(os.path.join(tempfile.gettempdir(), SCRATCH_SUBDIR))
+    return roots
+
+def _pick_scratch_root(required_bytes: int) -> str:
+    """
+    Pick the first scratch root with room for the task.
+
+    tmpfs is only used while it has at least twice the required space free,
+    so a large upload falls back to disk instead of exhausting memory.
+    """
+    roots = _scratch_roots()
+    for root in roots[:-1]:
+        try:
+            os.makedirs(root, exist_ok=True)
+            if shutil.disk_usage(root).free >= required_bytes * 2:
+                return root
+        except OSError as e:
+            logger.warning(f"Scratch root {root} unavailable: {str(e)}")
+    os.makedirs(roots[-1], exist_ok=True)
+    return roots[-1]
+
+def task_scratch_dir(task_id: str) -> Optional[str]:
+    """Return the existing scratch directory for a task, if any."""
+    for root in _scratch_roots():
+        path = os.path.join(root, task_id)
+        if os.path.isdir(path):
+            return path
+    return None
+
+def task_source_path(task_id: str, expected_bytes: int) -> str:
+    """
+    Create the task's scratch directory and return where its source video goes.
+
+    Args:
+        task_id (str): Unique task identifier
+        expected_bytes (int): Expected (or maximum) size of the video
+
+    Returns:
+        str: Path for the source video, to be sealed once fully written
+    """
+    root = _pick_scratch_root(expected_bytes)
+    scratch_dir = os.path.join(root, task_id)
+    os.makedirs(scratch_dir, exist_ok=True)
+    return os.path.join(scratch_dir, SOURCE_FILENAME)
+
+def seal_task_source(source_path: str):
+    """Make a fully written source video read-only for the pipeline stages."""
+    os.chmod(source_path, stat.S_IRUSR | stat.S_IRGRP)
+
+def cleanup_task_scratch(task_id: str):
+    """Remove a task's scratch directory and everything in it."""
+    scratch_dir = task_scratch_dir(task_id)
+    if not scratch_dir:
+        return
+    try:
+        shutil.rmtree(scratch_dir)
+        logger.info(f"Cleaned up scratch directory: {scratch_dir}")
+    except Exception as e:
+        logger.error(f"Error cleaning up scratch directory {scratch_dir}: {str(e)}")
+
+def cleanup_orphaned_scratch(max_age_seconds: Optional[int] = None) -> int:
+    """
+    Remove scratch directories left behind by crashed workers.
+
+    Args:
+        max_age_seconds (int, optional): Minimum age before a directory is removed
+
+    Returns:
+        int: Number of directories removed
+    """
+    max_age = max_age_seconds if max_age_seconds is not None else settings.SCRATCH_MAX_AGE_SECONDS
+    cutoff = time.time() - max_age
+    removed = 0
+    for root in _scratch_roots():
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            try:
+                if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path)
+                    removed += 1
+            except Exception as e:
+                logger.error(f"Error removing orphaned scratch directory {path}: {str(e)}")
+    if removed:
+        logger.info(f"Scratch janitor removed {removed} orphaned directories")
+    return removed
+
+async def run_scratch_janitor(interval_seconds: int = 600):
+    """Periodically remove orphaned scratch directories."""
+    while True:
+        await asyncio.to_thread(cleanup_orphaned_scratch)
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+
+class TaskStore:
+    """
+    Persistent store for TaskTracker records.
+
+    Records arrive already serialized as (task_id, json) pairs so the store
+    never touches live task dicts from its writer thread.
+    """
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return the stored record for a task, or None."""
+        raise NotImplementedError
+
+    def write(self, records: Iterable[Tuple[str, str]]):
+        """Persist a batch of serialized records."""
+        raise NotImplementedError
+
+    def is_empty(self) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        """Release file handles."""
+
+class SQLiteTaskStore(TaskStore):
+    """
+    One row per task in an SQLite database in WAL mode.
+
+    Each flush is a single transaction over the changed tasks only, and
+    readers (other workers, status queries) never block the writer. Safe to
+    share between worker processes on one host.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "task_id TEXT PRIMARY KEY, status TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write(self, records: Iterable[Tuple[str, str]]):
+        now = time.time()
+        rows = [(task_id, json.loads(payload).get("status"), payload, now) for task_id, payload in records]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tasks (task_id, status, data, updated_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM tasks LIMIT 1").fetchone() is None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JournalTaskStore(TaskStore):
+    """
+    Append-only JSONL journal of task records, compacted periodically.
+
+    Each flush appends one line per changed task. Only the byte offset and
+    length of each task's latest line are kept in memory; records are read
+    back from the file on demand. Once the journal holds more than
+    TASK_JOURNAL_COMPACT_FACTOR lines per live task it is rewritten with
+    only the latest record of each task. The journal is owned by one
+    process, so use it only with a single worker.
+    """
+
+    LINE_PREFIX = b'{"task_id": '
+
+    def __init__(self, journal_file: str, compact_factor: int):
+        self.journal_file = journal_file
+        self.compact_factor = compact_factor
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.journal_file) or ".", exist_ok=True)
+        # task_id -> (offset, length) of its latest journal line
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._lines = 0
+        self._file = open(self.journal_file, 'a+b')
+        self._build_index()
+
+    def _build_index(self):
+        """Index the journal by task id without decoding the task payloads."""
+        self._file.seek(0)
+        offset = 0
+        for line in self._file:
+            if not line.endswith(b"\n"):
+                # A torn final line from a crash mid-append; drop it so the next append starts clean
+                self._file.truncate(offset)
+                break
+            try:
+                task_id, _ = json.JSONDecoder().raw_decode(line[len(self.LINE_PREFIX):].decode())
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                offset += len(line)
+                continue
+            self._index[task_id] = (offset, len(line))
+            self._lines += 1
+            offset += len(line)
+        self._file.seek(0, os.SEEK_END)
+
+    @classmethod
+    def _line(cls, task_id: str, payload: str) -> bytes:
+        return cls.LINE_PREFIX + f'{json.dumps(task_id)}, "data": {payload}}}\n'.encode()
+
+    def _read_payload(self, task_id: str) -> Optional[str]:
+        """Return a task's latest serialized record; the caller holds the lock."""
+        location = self._index.get(task_id)
+        if location is None:
+            return None
+        offset, length = location
+        self._file.seek(offset)
+        line = self._file.read(length)
+        self._file.seek(0, os.SEEK_END)
+        return json.dumps(json.loads(line)["data"])
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            payload = self._read_payload(task_id)
+        return json.loads(payload) if payload else None
+
+    def write(self, records: Iterable[Tuple[str, str]]):
+        with self._lock:
+            for task_id, payload in records:
+                line = self._line(task_id, payload)
+                offset = self._file.tell()
+                self._file.write(line)
+                self._index[task_id] = (offset, len(line))
+                self._lines += 1
+            self._file.flush()
+            if self._lines > max(len(self._index), 1) * self.compact_factor:
+                self._compact()
+
+    def _compact(self):
+        """Atomically rewrite the journal with one line per task."""
+        tmp_file = f"{self.journal_file}.tmp"
+        index = {}
+        with open(tmp_file, 'wb') as f:
+            for task_id in list(self._index):
+                line = self._line(task_id, self._read_payload(task_id))
+                index[task_id] = (f.tell(), len(line))
+                f.write(line)
+        self._file.close()
+        os.replace(tmp_file, self.journal_file)
+        self._file = open(self.journal_file, 'a+b')
+        self._index = index
+        self._lines = len(index)
+
+    def is_empty(self) -> bool:
+        return not self._index
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class RedisTaskStore(TaskStore):
+    """
+    Task records as Redis keys, shared by every worker and host.
+
+    Keys expire after RESULT_ARCHIVE_TTL_SECONDS, like archived results.
+    Works with any Redis-protocol server (Redis, Valkey, KeyDB, ...).
+    """
+
+    KEY_PREFIX = "video-analysis:task:"
+
+    def __init__(self, url: str, ttl_seconds: int):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        payload = self.client.get(f"{self.KEY_PREFIX}{task_id}")
+        return json.loads(payload) if payload else None
+
+    def write(self, records: Iterable[Tuple[str, str]]):
+        pipeline = self.client.pipeline(transaction=False)
+        for task_id, payload in records:
+            pipeline.set(f"{self.KEY_PREFIX}{task_id}", payload, ex=self.ttl_seconds)
+        pipeline.execute()
+
+    def is_empty(self) -> bool:
+        return next(self.client.scan_iter(match=f"{self.KEY_PREFIX}*", count=100), None) is None
+
+    def close(self):
+        self.client.close()
+
+def create_task_store() -> TaskStore:
+    """Build the store selected by TASK_STORE_BACKEND ("sqlite", "journal" or "redis")."""
+    if settings.TASK_STORE_BACKEND == "redis":
+        return RedisTaskStore(settings.REDIS_URL, settings.RESULT_ARCHIVE_TTL_SECONDS)
+    if settings.TASK_STORE_BACKEND == "journal":
+        return JournalTaskStore(settings.TASK_JOURNAL_FILE, settings.TASK_JOURNAL_COMPACT_FACTOR)
+    return SQLiteTaskStore(settings.TASK_STORE_FILE)
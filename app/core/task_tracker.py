@@ -1,32 +1,167 @@
+import asyncio
 import json
 from datetime import datetime
 import os
-from typing import Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Set
+
+from app.core.config import settings
+from app.core.task_store import TaskStore, create_task_store
+
+# Events buffered per subscriber before the oldest progress event is dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
 
 class TaskTracker:
-    def __init__(self, data_file: str = "docs/data_record.json"):
-        self.data_file = data_file
+    def __init__(self, store: TaskStore = None, legacy_data_file: str = "docs/data_record.json"):
+        self.store = store or create_task_store()
+        self.legacy_data_file = legacy_data_file
+        # Tasks run by this process, plus recently finished ones until
+        # TASK_STATE_TTL_SECONDS; older records are read back from the store
         self.tasks: Dict[str, Dict[str, Any]] = {}
+        self._finished: Dict[str, float] = {}
+        # A single writer thread keeps store writes off the event loop and in order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-tracker")
+        self._dirty: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Per-task event queues for live progress streams
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
         self.load_data()
 
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Return a queue receiving the task's progress and completion events."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        """Stop delivering events to a queue returned by subscribe."""
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+
+    def publish(self, task_id: str, event: Dict[str, Any]):
+        """
+        Deliver an event to every subscriber of the task.
+
+        A subscriber that falls behind loses its oldest buffered event rather
+        than blocking the task, so events must be safe to miss: progress is
+        superseded by the next update, and streamed description deltas by
+        the full description event that follows them.
+        """
+        for queue in self._subscribers.get(task_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
     def load_data(self):
-        """Load existing data from the JSON file."""
+        """
+        Prepare the store; no task history is loaded into memory.
+
+        Other workers may share the store, so records of tasks still in
+        progress are not adopted; they are read from the store on demand.
+        A legacy data_record.json is imported only while the store is empty,
+        so its history is parsed at most once.
+        """
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    self.tasks = json.load(f)
+            if self.store.is_empty() and os.path.exists(self.legacy_data_file):
+                with open(self.legacy_data_file, 'r') as f:
+                    legacy_tasks = json.load(f)
+                self.store.write((task_id, json.dumps(data)) for task_id, data in legacy_tasks.items())
+                print(f"Imported {len(legacy_tasks)} tasks from {self.legacy_data_file}")
         except Exception as e:
             print(f"Error loading data: {str(e)}")
-            self.tasks = {}
 
-    def save_data(self):
-        """Save current data to the JSON file."""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Return a task's record, from memory if it is live, else from the store."""
+        task = self.tasks.get(task_id)
+        if task is not None:
+            return task
+        try:
+            return self.store.get(task_id)
+        except Exception as e:
+            print(f"Error reading task {task_id}: {str(e)}")
+            return None
+
+    def save_data(self, task_id: str):
+        """
+        Mark a task as changed and schedule a batched flush.
+
+        Progress ticks within TASK_STORE_FLUSH_INTERVAL_SECONDS of each other
+        are written together, and only the tasks that changed are written.
+        """
+        self._dirty.add(task_id)
+        if self._flush_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (startup, scripts): write straight away
+            self.flush()
+            return
+        self._flush_handle = loop.call_later(settings.TASK_STORE_FLUSH_INTERVAL_SECONDS, self.flush)
+
+    def flush(self):
+        """
+        Write all changed tasks to the store.
+
+        Records are serialized on the caller's thread so they are consistent,
+        and the store write happens on the writer thread.
+        """
+        self._flush_handle = None
+        self._evict_finished()
+        dirty, self._dirty = self._dirty, set()
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.tasks, f, indent=2)
+            records = [(task_id, json.dumps(self.tasks[task_id])) for task_id in dirty if task_id in self.tasks]
         except Exception as e:
             print(f"Error saving data: {str(e)}")
+            return
+        if records:
+            self._writer.submit(self._write_records, records)
+
+    def _evict_finished(self):
+        """
+        Drop finished tasks past TASK_STATE_TTL_SECONDS, or beyond
+        TASK_STATE_MAX_FINISHED, from memory.
+
+        Tasks with unflushed changes are kept until a later pass, so a record
+        always reaches the store before it leaves memory.
+        """
+        cutoff = time.monotonic() - settings.TASK_STATE_TTL_SECONDS
+        excess = len(self._finished) - settings.TASK_STATE_MAX_FINISHED
+        for task_id, finished_at in list(self._finished.items()):
+            if finished_at >= cutoff and excess <= 0:
+                break
+            if task_id in self._dirty:
+                continue
+            del self._finished[task_id]
+            self.tasks.pop(task_id, None)
+            excess -= 1
+
+    def resident_stats(self) -> Dict[str, int]:
+        """Count and approximate size of the task records held in memory."""
+        return {
+            "entries": len(self.tasks),
+            "finished": len(self._finished),
+            "bytes": sum(len(json.dumps(task)) for task in self.tasks.values()),
+        }
+
+    def _write_records(self, records: list):
+        try:
+            self.store.write(records)
+        except Exception as e:
+            print(f"Error saving data: {str(e)}")
+
+    def close(self):
+        """Flush pending changes and wait for them to reach the store."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self.flush()
+        self._writer.shutdown(wait=True)
+        self.store.close()
 
     def _print_progress_indicator(self, message: str, timing_info: str = None):
         """Print a visual progress indicator with timing information."""
@@ -43,6 +178,34 @@ class TaskTracker:
         end = datetime.fromisoformat(end_time) if end_time else datetime.now()
         return (end - start).total_seconds()
 
+    def queue_task(self, task_id: str, position: int, estimated_wait_seconds: float):
+        """
+        Record a task waiting in a worker's job queue, or refresh its position.
+
+        The record reaches the shared store like any other, so every worker
+        can report the task's queue position and expected start until
+        start_task replaces it.
+        """
+        task = self.tasks.get(task_id)
+        if task is None or task.get("status") != "queued":
+            queued_at = datetime.now().isoformat()
+            task = self.tasks[task_id] = {
+                "start_time": queued_at,
+                "queued_at": queued_at,
+                "steps": {},
+                "current_progress": 0,
+                "current_step": "Queued",
+                "total_steps": 0,
+                "status": "queued",
+                "timing": {
+                    "start_time": queued_at,
+                    "steps_timing": {}
+                }
+            }
+        task["queue_position"] = position
+        task["estimated_start_time"] = time.time() + estimated_wait_seconds
+        self.save_data(task_id)
+
     def start_task(self, task_id: str):
         """Initialize a new task with timing and progress data."""
         start_time = datetime.now().isoformat()
@@ -61,7 +224,7 @@ class TaskTracker:
             f"Starting new task: {task_id}",
             f"Start Time: {datetime.fromisoformat(start_time).strftime('%Y-%m-%d %H:%M:%S')}"
         )
-        self.save_data()
+        self.save_data(task_id)
 
     def update_progress(self, task_id: str, step_name: str, progress: int):
         """Update progress for a specific step in the task."""
@@ -94,7 +257,16 @@ class TaskTracker:
 
         # Update overall progress
         self.tasks[task_id]["current_progress"] = progress
-        self.save_data()
+        self.tasks[task_id]["current_step"] = step_name
+        self.publish(task_id, {"event": "progress", "step": step_name, "progress": progress})
+        self.save_data(task_id)
+
+    def record_metric(self, task_id: str, name: str, value: Any):
+        """Record a named performance metric for the task."""
+        if task_id not in self.tasks:
+            return
+        self.tasks[task_id].setdefault("metrics", {})[name] = value
+        self.save_data(task_id)
 
     def complete_step(self, task_id: str, step_name: str):
         """Mark a step as completed and record its completion time."""
@@ -114,7 +286,7 @@ class TaskTracker:
                 f"Completed step: {step_name}",
                 f"Step Duration: {duration:.2f} seconds"
             )
-            self.save_data()
+            self.save_data(task_id)
 
     def complete_task(self, task_id: str, status: str = "completed"):
         """Mark a task as completed and calculate total duration."""
@@ -147,7 +319,9 @@ class TaskTracker:
             )
             
             self.tasks[task_id]["current_progress"] = 100
-            self.save_data()
+            self._finished[task_id] = time.monotonic()
+            self.publish(task_id, {"event": "complete", "status": status})
+            self.save_data(task_id)
 
     def _format_task_summary(self, task_id: str, status: str, total_duration: float, step_durations: Dict[str, float]) -> str:
         """Format the task summary with timing information."""
@@ -1,29 +1,49 @@
 import os
-from google import genai  # Import the Gemini API library
-import tempfile
 from app.core.logging import logger
-from datetime import datetime
 from app.core.config import settings
 from app.core.task_tracker import task_tracker
-from pydub import AudioSegment
-from typing import Tuple, List, Optional
-import math
+from app.core.executors import run_cpu, run_io
+from app.core.llm_cache import cached_llm_call
+from app.services.llm_provider import get_provider
+from imageio_ffmpeg import get_ffmpeg_exe
+from typing import AsyncIterator, Dict, Tuple, List, Optional
 import re
 import json
 import asyncio
-
-OUTPUT_FOLDER = os.path.abspath("video_analysis_output")
-openai_model = settings.openai_model
-gemini_model = settings.gemini_model
-if gemini_model:
-    from google import genai
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-if openai_model:
-    from openai import AsyncOpenAI
-    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+import numpy as np
+from contextlib import aclosing
 
 MAX_CHUNK_SIZE = 24 * 1024 * 1024  # 24MB to stay safely under the 25MB limit
-CHUNK_DURATION = 1.5 * 60 * 1000  # 10 minutes in milliseconds
+CHUNK_DURATION = 1.5 * 60 * 1000  # 90 seconds in milliseconds
+
+class NoAudioStreamError(Exception):
+    """Raised when a video has no audio stream to transcribe."""
+
+# Audio is decoded once by ffmpeg to 16 kHz mono 16-bit PCM, the rate speech models resample to anyway
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_SAMPLE_BYTES = 2
+CHUNK_DIRNAME = "audio_chunks"
+# Chunks encoded at once; decoding waits for a free encoder, bounding buffered PCM
+AUDIO_ENCODERS = 4
+# Longest run of words looked for when removing text repeated across a chunk boundary
+MAX_OVERLAP_WORDS = 40
+# Voice activity detection analysis frame
+VAD_FRAME_MS = 30
+
+# Chunk encodings: file extension, MIME type and ffmpeg codec arguments
+AUDIO_CHUNK_FORMATS = {
+    "flac": (".flac", "audio/flac", ["-c:a", "flac"]),
+    "opus": (".ogg", "audio/ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "voip"]),
+}
+TRANSCRIPTION_PROMPT = "Transcribe the following audio file into text:"
+CONTENT_SAFETY_PROMPT = """You are a very strict content moderator. Your task is to identify any inappropriate, 
+adult, sexual, NSFW, or suggestive content in the text. Be extremely conservative - if there's any doubt,
+mark it as inappropriate. Return a JSON object with:
+{
+    "is_safe": boolean,
+    "warnings": [list of specific warnings],
+    "reason": "detailed explanation"
+}"""
 
 # NSFW content detection patterns
 NSFW_PATTERNS = [
@@ -35,133 +55,376 @@ NSFW_PATTERNS = [
     r'\b(?:hentai|rule34|onlyfans)\b'
 ]
 
-async def process_audio(video_content: bytes, task_id: str = None) -> Tuple[List[dict], Optional[str]]:
+def _read_file(path: str) -> bytes:
+    """Read a whole file into memory."""
+    with open(path, "rb") as f:
+        return f.read()
+
+async def _iter_pcm_windows(video_path: str, window_ms: float) -> AsyncIterator[bytes]:
+    """
+    Stream the soundtrack from ffmpeg as 16 kHz mono PCM, one window at a time.
+
+    Only the current window is held in memory, whatever the video length.
+
+    Args:
+        video_path (str): Path to the source video file
+        window_ms (float): Window length in milliseconds
+
+    Yields:
+        bytes: Little-endian 16-bit PCM; the last window may be shorter
+    """
+    window_bytes = int(window_ms / 1000 * AUDIO_SAMPLE_RATE) * AUDIO_SAMPLE_BYTES
+    process = await asyncio.create_subprocess_exec(
+        get_ffmpeg_exe(), "-nostdin", "-v", "error", "-i", video_path,
+        "-vn", "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE), "-f", "s16le", "-",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # Drain stderr alongside stdout so a chatty ffmpeg cannot block on a full pipe
+    stderr_task = asyncio.create_task(process.stderr.read())
+    total_bytes = 0
+    try:
+        while True:
+            try:
+                window = await process.stdout.readexactly(window_bytes)
+            except asyncio.IncompleteReadError as e:
+                window = e.partial
+            if window:
+                total_bytes += len(window)
+                yield window
+            if len(window) < window_bytes:
+                break
+        await process.wait()
+        stderr = (await stderr_task).decode(errors="replace").strip()
+        if process.returncode != 0 and not total_bytes:
+            # ffmpeg's error when -vn leaves nothing to write, i.e. the input has no audio
+            if "does not contain any stream" in stderr:
+                raise NoAudioStreamError("Video has no audio stream")
+            raise RuntimeError(f"ffmpeg audio extraction failed: {stderr}")
+        if stderr:
+            logger.warning(f"ffmpeg reported while extracting audio: {stderr}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        if not stderr_task.done():
+            stderr_task.cancel()
+
+async def _encode_chunk(pcm: bytes, chunk_path: str):
+    """Encode one PCM window to the configured compressed format with ffmpeg."""
+    _, _, codec_args = AUDIO_CHUNK_FORMATS[settings.AUDIO_CHUNK_FORMAT]
+    process = await asyncio.create_subprocess_exec(
+        get_ffmpeg_exe(), "-nostdin", "-v", "error", "-y",
+        "-f", "s16le", "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "1", "-i", "-",
+        *codec_args, chunk_path,
+        stdin=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate(pcm)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg chunk encoding failed: {stderr.decode(errors='replace').strip()}")
+
+def _speech_frames(pcm: bytes) -> np.ndarray:
+    """
+    Flag the VAD_FRAME_MS frames of a PCM window that look like speech.
+
+    A frame counts as speech when its RMS level reaches VAD_ENERGY_THRESHOLD_DB
+    (dBFS) and its zero-crossing rate stays under VAD_MAX_ZERO_CROSSING_RATE,
+    which rejects loud broadband noise such as hiss or wind. A trailing
+    partial frame is ignored.
+
+    Args:
+        pcm (bytes): Little-endian 16-bit mono PCM at AUDIO_SAMPLE_RATE
+
+    Returns:
+        np.ndarray: Boolean speech flag per frame
+    """
+    frame_len = AUDIO_SAMPLE_RATE * VAD_FRAME_MS // 1000
+    samples = np.frombuffer(pcm, dtype="<i2")
+    num_frames = len(samples) // frame_len
+    frames = samples[:num_frames * frame_len].reshape(num_frames, frame_len).astype(np.float32) / 32768.0
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+    level_db = 20 * np.log10(rms + 1e-10)
+    signs = np.signbit(frames)
+    zero_crossing_rate = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return (level_db >= settings.VAD_ENERGY_THRESHOLD_DB) & (zero_crossing_rate <= settings.VAD_MAX_ZERO_CROSSING_RATE)
+
+def _find_speech_span(pcm: bytes, skip_bytes: int = 0) -> Tuple[Optional[Tuple[int, int]], int, int]:
+    """
+    Locate the span of a PCM window worth transcribing.
+
+    Speech frames are padded by VAD_PADDING_MS on each side so word onsets
+    and soft endings survive the trim. Only frames after skip_bytes (the
+    overlap already sent with the previous chunk) decide whether the window
+    holds speech; a window with less than VAD_MIN_SPEECH_MS of it is dropped.
+
+    Args:
+        pcm (bytes): Little-endian 16-bit mono PCM at AUDIO_SAMPLE_RATE
+        skip_bytes (int): Leading bytes that belong to the previous window
+
+    Returns:
+        Tuple[Optional[Tuple[int, int]], int, int]: Start and end byte offsets of
+        the speech span (None if the window is silent), then the speech and total
+        frame counts of the part after skip_bytes
+    """
+    frame_len = AUDIO_SAMPLE_RATE * VAD_FRAME_MS // 1000
+    frame_bytes = frame_len * AUDIO_SAMPLE_BYTES
+    speech = _speech_frames(pcm)
+    first_own_frame = skip_bytes // frame_bytes
+    own = speech[first_own_frame:]
+    speech_count = int(own.sum())
+    if not speech_count or speech_count * VAD_FRAME_MS < settings.VAD_MIN_SPEECH_MS:
+        return None, speech_count, len(own)
+
+    padding = settings.VAD_PADDING_MS // VAD_FRAME_MS
+    padded = np.convolve(speech, np.ones(2 * padding + 1))[padding:padding + len(speech)] > 0
+    speech_indices = np.flatnonzero(padded)
+    start = int(speech_indices[0]) * frame_bytes
+    end = (int(speech_indices[-1]) + 1) * frame_bytes
+    if speech_indices[-1] == len(speech) - 1:
+        # Keep the partial frame at the end of the window
+        end = len(pcm)
+    return (start, end), speech_count, len(own)
+
+async def _extract_audio_chunks(video_path: str, output_folder: str) -> Tuple[int, List[Dict], Dict]:
+    """
+    Stream the soundtrack into compressed CHUNK_DURATION chunk files.
+
+    ffmpeg decodes straight to 16 kHz mono, so the full-rate track is never
+    materialized, in memory or on disk; each window is encoded to FLAC or
+    Opus while the next one is decoded. Every chunk after the first also
+    starts with the last AUDIO_CHUNK_OVERLAP_MS of the previous window, so
+    words cut at a boundary are heard whole by one of the two chunks.
+
+    With VAD_ENABLED, windows without speech are never encoded or sent for
+    transcription, and the rest are trimmed to their speech span.
+
+    Args:
+        video_path (str): Path to the source video file
+        output_folder (str): Directory for the chunk files
+
+    Returns:
+        Tuple[int, List[Dict], Dict]: Audio length in milliseconds, the chunks
+        in time order (each with its path, start_ms and end_ms) and voice
+        activity stats
+    """
+    extension, _, _ = AUDIO_CHUNK_FORMATS[settings.AUDIO_CHUNK_FORMAT]
+    os.makedirs(output_folder, exist_ok=True)
+    chunks = []
+    encoders = []
+    encoder_slots = asyncio.Semaphore(AUDIO_ENCODERS)
+    total_samples = 0
+    overlap_bytes = int(settings.AUDIO_CHUNK_OVERLAP_MS / 1000 * AUDIO_SAMPLE_RATE) * AUDIO_SAMPLE_BYTES
+    previous_tail = b""
+    windows_total = 0
+    speech_frames = 0
+    total_frames = 0
+
+    async def encode(window: bytes, chunk_path: str):
+        try:
+            await _encode_chunk(window, chunk_path)
+        finally:
+            encoder_slots.release()
+
+    try:
+        async with aclosing(_iter_pcm_windows(video_path, CHUNK_DURATION)) as windows:
+            async for window in windows:
+                windows_total += 1
+                start_sample = total_samples - len(previous_tail) // AUDIO_SAMPLE_BYTES
+                total_samples += len(window) // AUDIO_SAMPLE_BYTES
+                pcm = previous_tail + window
+                previous_tail = window[-overlap_bytes:] if overlap_bytes else b""
+
+                if settings.VAD_ENABLED:
+                    span, window_speech, window_frames = await run_cpu(_find_speech_span, pcm, len(pcm) - len(window))
+                    speech_frames += window_speech
+                    total_frames += window_frames
+                    if span is None:
+                        logger.info(f"No speech in audio window {windows_total}, skipping transcription")
+                        continue
+                    start_byte, end_byte = span
+                    pcm = pcm[start_byte:end_byte]
+                    start_sample += start_byte // AUDIO_SAMPLE_BYTES
+
+                chunk_path = os.path.join(output_folder, f"chunk_{len(chunks):04d}{extension}")
+                chunks.append({
+                    "path": chunk_path,
+                    "start_ms": start_sample * 1000 // AUDIO_SAMPLE_RATE,
+                    "end_ms": (start_sample + len(pcm) // AUDIO_SAMPLE_BYTES) * 1000 // AUDIO_SAMPLE_RATE,
+                })
+                await encoder_slots.acquire()
+                encoders.append(asyncio.create_task(encode(pcm, chunk_path)))
+        await asyncio.gather(*encoders)
+    except Exception:
+        for encoder in encoders:
+            encoder.cancel()
+        raise
+
+    for i, chunk in enumerate(chunks):
+        chunk_size = os.path.getsize(chunk["path"])
+        logger.info(f"Chunk {i+1}/{len(chunks)} size: {chunk_size} bytes")
+        if chunk_size > MAX_CHUNK_SIZE:
+            raise ValueError(f"Chunk {i+1} size ({chunk_size} bytes) exceeds maximum allowed size ({MAX_CHUNK_SIZE} bytes)")
+
+    audio_length = total_samples * 1000 // AUDIO_SAMPLE_RATE
+    vad_stats = {
+        "speech_ratio": round(speech_frames / total_frames, 3) if total_frames else None,
+        "chunks_transcribed": len(chunks),
+        "transcription_calls_avoided": windows_total - len(chunks),
+    }
+    logger.info(f"Audio length: {audio_length} ms in {len(chunks)} {settings.AUDIO_CHUNK_FORMAT} chunks, voice activity: {vad_stats}")
+    return audio_length, chunks, vad_stats
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+def _merge_overlap(previous: str, current: str) -> str:
+    """
+    Drop the start of current that repeats the end of previous.
+
+    Adjacent chunks share AUDIO_CHUNK_OVERLAP_MS of audio, so both
+    transcripts usually contain the same few words at the boundary. The
+    longest run (of at least two words) that ends previous and starts
+    current is removed from current; words are compared ignoring case and
+    punctuation.
     """
-    Process audio from video content, handling large files by splitting into chunks.
+    previous_words = [_normalize_word(word) for word in previous.split()[-MAX_OVERLAP_WORDS:]]
+    current_words = current.split()
+    normalized = [_normalize_word(word) for word in current_words[:MAX_OVERLAP_WORDS]]
+    for size in range(min(len(previous_words), len(normalized)), 1, -1):
+        if previous_words[-size:] == normalized[:size]:
+            return " ".join(current_words[size:])
+    return current
+
+def _stitch_transcripts(chunks: List[Dict], transcriptions: List[str]) -> List[Dict]:
+    """
+    Join chunk transcripts in time order into timestamped segments.
+
+    Returns:
+        List[Dict]: One segment per non-empty chunk with start, end (seconds) and text
+    """
+    segments = []
+    previous = ""
+    for chunk, text in zip(chunks, transcriptions):
+        text = text.strip()
+        if not text:
+            continue
+        if previous:
+            text = _merge_overlap(previous, text)
+        if not text:
+            continue
+        segments.append({
+            "start": round(chunk["start_ms"] / 1000, 2),
+            "end": round(chunk["end_ms"] / 1000, 2),
+            "text": text,
+        })
+        previous = text
+    return segments
+
+async def process_audio(video_path: str, task_id: str = None) -> List[dict]:
     """
-    temp_video_file = None
-    temp_audio_file = None
-    output_folder = "video_analysis_output"
+    Process audio from video content, handling long soundtracks by splitting into chunks.
+
+    The soundtrack is streamed out of ffmpeg into compact mono 16 kHz chunk
+    files in the task's scratch area, and each chunk's own bytes are sent for
+    transcription.
+
+    Args:
+        video_path (str): Path to the task's shared scratch copy of the video
+        task_id (str, optional): Task identifier for progress tracking
+
+    Returns:
+        List[dict]: Transcription result
+    """
+    output_folder = os.path.join(os.path.dirname(video_path), CHUNK_DIRNAME)
+    _, mime_type, _ = AUDIO_CHUNK_FORMATS[settings.AUDIO_CHUNK_FORMAT]
+    chunks = []
     
     try:
-        # Create output folder if it doesn't exist
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
-            logger.info(f"Output folder created/confirmed: {os.path.abspath(output_folder)}")
-        
-        # Save video content to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            temp_file.write(video_content)
-            temp_video_file = temp_file.name
-        logger.info(f"Temporary video file created at: {temp_video_file}")
-        
-        if task_id:
-            task_tracker.update_progress(task_id, "Video file saved", 10)
-        
-        # Load video and extract audio
-        video = AudioSegment.from_file(temp_video_file)
         if task_id:
             task_tracker.update_progress(task_id, "Video loaded for audio extraction", 15)
-        
-        # Save extracted audio
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        audio_filename = os.path.join(output_folder, f"extracted_audio_{timestamp}.wav")
-        video.export(audio_filename, format="wav")
-        logger.info(f"Saved extracted audio locally: {audio_filename}")
+        try:
+            audio_length, chunks, vad_stats = await _extract_audio_chunks(video_path, output_folder)
+            no_speech_message = "No speech detected in audio"
+        except NoAudioStreamError:
+            # Screen recordings and B-roll often carry no soundtrack at all; like silence, that is not a failure
+            chunks, vad_stats = [], None
+            no_speech_message = "Video has no audio stream"
+        num_chunks = len(chunks)
         
         if task_id:
             task_tracker.update_progress(task_id, "Audio extracted and saved", 25)
-        
-        # Get file info
-        file_size = os.path.getsize(audio_filename)
-        logger.info(f"Audio file size: {file_size} bytes")
+            if settings.VAD_ENABLED and vad_stats:
+                task_tracker.record_metric(task_id, "audio_vad", vad_stats)
+
+        if not chunks:
+            logger.info(f"{no_speech_message}, skipping transcription")
+            if task_id:
+                task_tracker.update_progress(task_id, no_speech_message, 35)
+                task_tracker.update_progress(task_id, "Audio processing completed", 40)
+            return [{"text": "", "segments": []}]
         
         # Process audio in chunks if necessary
         if task_id:
             task_tracker.update_progress(task_id, "Starting audio transcription", 30)
         
-        logger.info("Transcribing audio using OpenAI Whisper API...")
-        
-        # Calculate number of chunks needed
-        audio_length = len(video)
-        logger.info(f"Audio length: {audio_length} ms")
-        num_chunks = math.ceil(audio_length / CHUNK_DURATION)
-        logger.info(f"Splitting audio into {num_chunks} chunks, ~{CHUNK_DURATION / 1000:.2f} seconds per chunk")        
-        
-        # Process audio in chunks
-        transcriptions = []
-        chunk_files = []
+        provider = get_provider()
+        logger.info(f"Transcribing audio using {provider.name} ({provider.transcription_model})...")
+        semaphore = asyncio.Semaphore(settings.TRANSCRIPTION_CONCURRENCY)
+        completed = 0
+        failed = 0
+
+        async def transcribe(i: int, chunk: Dict) -> str:
+            nonlocal completed, failed
+            try:
+                async with semaphore:
+                    audio_data = await run_io(_read_file, chunk["path"])
+                    if not audio_data:
+                        logger.warning(f"Chunk {i+1}/{num_chunks} is empty. Skipping transcription.")
+                        return ""
+
+                    async def transcribe_chunk():
+                        return await provider.transcribe(TRANSCRIPTION_PROMPT, audio_data, mime_type)
+
+                    text = await cached_llm_call(
+                        "transcription", f"{provider.name}:{provider.transcription_model}",
+                        TRANSCRIPTION_PROMPT, transcribe_chunk, audio_data)
+                logger.info(f"Chunk {i+1}/{num_chunks} transcribed successfully")
+                return text
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error transcribing chunk {i+1}/{num_chunks}: {str(e)}")
+                return ""
+            finally:
+                completed += 1
+                if task_id:
+                    progress = 30 + completed * (35 - 30) / num_chunks
+                    task_tracker.update_progress(task_id, f"Transcribed chunk {completed}/{num_chunks}", progress)
         
         try:
-            for i in range(num_chunks):
-                start_time = i * CHUNK_DURATION
-                end_time = min((i + 1) * CHUNK_DURATION, audio_length)
-                
-                # Extract chunk
-                chunk = video[start_time:end_time]
-                
-                # Save chunk to temporary file
-                with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_chunk:
-                    chunk.export(temp_chunk.name, format="wav")
-                    chunk_files.append(temp_chunk.name)
-                    
-                    # Check chunk size
-                    chunk_size = os.path.getsize(temp_chunk.name)
-                    logger.info(f"Chunk {i+1}/{num_chunks} size: {chunk_size} bytes")
-                    
-                    if chunk_size > MAX_CHUNK_SIZE:
-                        raise ValueError(f"Chunk {i+1} size ({chunk_size} bytes) exceeds maximum allowed size ({MAX_CHUNK_SIZE} bytes)")
-                    
-                    logger.info(f"file name {temp_chunk.name}")
-                    with open(audio_filename, "rb") as audio_file:
-                        try:
-                            audio_data = audio_file.read()
-                        except Exception as e:
-                            logger.warning(f"Error reading audio file: {str(e)} {temp_chunk.name} {len(audio_file)}")
-                    
-                        try: 
-                            assert len(audio_data) > 0
-                        except Exception as e:
-                            # logger.error(f"Chunk {i+1}/{num_chunks} is empty. Skipping transcription.")
-                            logger.warning(f"Chunk {i+1}/{num_chunks} is empty. Skipping transcription. {len(audio_data)}")
-                            transcriptions.append("")
-                            continue
-
-                        response = await client.aio.models.generate_content(
-                            model='gemini-2.0-flash',
-                            contents=[
-                                "Transcribe the following audio file into text:",
-                                genai.types.Part.from_bytes(data=audio_data,mime_type='audio/wav')
-                                ],
-                        )
-                        
-                        # Extract and return the transcription
-                        transcriptions.append(response.text.strip())
-                        
-                    logger.info(f"Chunk {i+1}/{num_chunks} transcribed successfully")
-                    
-                    if task_id:
-                        progress = 30 + (i + 1) * (35 - 30) / num_chunks
-                        task_tracker.update_progress(task_id, f"Transcribed chunk {i+1}/{num_chunks}", progress)
-            
-            # Combine all transcriptions
-            combined_text = " ".join(transcriptions)
-            result = [{"text": combined_text}]
+            # Chunks are transcribed concurrently and stitched back in time order
+            transcriptions = await asyncio.gather(*[transcribe(i, chunk) for i, chunk in enumerate(chunks)])
+            if num_chunks and failed == num_chunks:
+                raise RuntimeError("Every audio chunk failed to transcribe")
+
+            segments = _stitch_transcripts(chunks, transcriptions)
+            combined_text = " ".join(segment["text"] for segment in segments)
+            result = [{"text": combined_text, "segments": segments, "failed_chunks": failed}]
             logger.info(f"Audio Transcription: {result}")
             
             if task_id:
                 task_tracker.update_progress(task_id, "Audio transcription completed", 35)
                 task_tracker.update_progress(task_id, "Audio processing completed", 40)
             
-            return result, audio_filename
+            return result
             
         finally:
             # Clean up chunk files
-            for chunk_file in chunk_files:
-                if os.path.exists(chunk_file):
+            for chunk in chunks:
+                if os.path.exists(chunk["path"]):
                     try:
-                        os.unlink(chunk_file)
-                        logger.info(f"Cleaned up chunk file: {chunk_file}")
+                        os.unlink(chunk["path"])
+                        logger.info(f"Cleaned up chunk file: {chunk['path']}")
                     except Exception as e:
                         logger.error(f"Error cleaning up chunk file: {str(e)}")
         
@@ -170,23 +433,7 @@ async def process_audio(video_content: bytes, task_id: str = None) -> Tuple[List
         logger.error(error_msg)
         if task_id:
             task_tracker.update_progress(task_id, f"Error: {error_msg}", 35)
-        return [{"error": error_msg}], None
-        
-    finally:
-        # Clean up temporary files
-        if temp_video_file and os.path.exists(temp_video_file):
-            try:
-                os.unlink(temp_video_file)
-                logger.info(f"Cleaned up temporary video file: {temp_video_file}")
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary video file: {str(e)}")
-
-        if audio_filename and os.path.exists(audio_filename):
-            try:
-                os.unlink(audio_filename)
-                logger.info(f"Cleaned up temporary audio file: {audio_filename}")
-            except Exception as e:
-                logger.error(f"Error cleaning up temporary audio file: {str(e)}")
+        return [{"error": error_msg}]
 
 async def check_content_safety(text: str) -> Tuple[bool, List[str]]:
     """
@@ -204,47 +451,12 @@ async def check_content_safety(text: str) -> Tuple[bool, List[str]]:
         if warnings:
             return False, warnings
 
-        # Use OpenAI to check for more subtle NSFW content
+        # Use the configured model to check for more subtle NSFW content
         try:
-            if openai_model:
-                response = await client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": """You are a very strict content moderator. Your task is to identify any inappropriate, 
-                            adult, sexual, NSFW, or suggestive content in the text. Be extremely conservative - if there's any doubt,
-                            mark it as inappropriate. Return a JSON object with:
-                            {
-                                "is_safe": boolean,
-                                "warnings": [list of specific warnings],
-                                "reason": "detailed explanation"
-                            }"""
-                        },
-                        {
-                            "role": "user",
-                            "content": text
-                        }
-                    ],
-                    temperature=0.1,
-                    response_format={ "type": "json_object" },
-                    timeout=30  # 30 seconds timeout
-                )
-                
-                result = json.loads(response.choices[0].message.content)
-            if gemini_model:
-                prompt = f'''system: You are a very strict content moderator. Your task is to identify any inappropriate, 
-                adult, sexual, NSFW, or suggestive content in the text. Be extremely conservative - if there's any doubt,
-                mark it as inappropriate. Return a JSON object with:
-                {{
-                    "is_safe": boolean,
-                    "warnings": [list of specific warnings],
-                    "reason": "detailed explanation"
-                }}
-                user: {text}
-                system:'''
-                response = await client.aio.models.generate_content(model='gemini-2.0-flash',contents = prompt,  config=genai.types.GenerateContentConfig(temperature= 0.1, response_mime_type= 'application/json'))
-                result = response.text.replace('```json','').replace('```','')
+            result = await asyncio.wait_for(
+                get_provider().extract_structured(text, system=CONTENT_SAFETY_PROMPT, temperature=0.1),
+                timeout=30  # 30 seconds timeout
+            )
 
             if not result.get("is_safe", False):
                 warnings.extend(result.get("warnings", []))
@@ -1,121 +1,145 @@
 import base64
-from google import genai
 from app.core.task_tracker import task_tracker
 from app.core.config import settings
 from app.core.logging import logger
-from typing import List
+from app.services.video_processor import GRID_MIME_TYPE
+from app.core.llm_cache import cached_llm_call
+from app.services.llm_provider import LLMProvider, get_provider
+from typing import List, Tuple
+import asyncio
 import re
 
 
-openai_model = settings.openai_model
-gemini_model = settings.gemini_model
-if gemini_model:
-    from google import genai
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-if openai_model:
-    from openai import AsyncOpenAI
-    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+GRID_ANALYSIS_PROMPT = """
+    Analyze this series of video frames with particular attention to Christian themes and NSFW content:
 
-async def analyze_grid_images(base64_images: List[str], task_id: str = None) -> List[str]:
+    Provide a comprehensive description focusing on:
+    1. The speaker's actions and expressions
+    2. Any text overlays or icons and their significance
+    3. Visual elements and their significance
+    4. The overall theme and message visible in these frames
+    5. Number of faces visible
+    6. Gender identification of visible individuals
+    7. Personality traits and demeanor of main individuals
+    8. Notable interactions or expressions
+    9. Visual progression and scene changes
+    10. Any identifiable individuals or notable features
+
+    Focus on visual analysis only. Describe the progression naturally without mentioning grid layout.
+    Write the description only for 10 above points.
+    """
+
+async def _describe_grid(base64_image: str) -> str:
+    """
+    Describe one grid image with the configured vision model.
+
+    Args:
+        base64_image (str): Base64 encoded grid image
+
+    Returns:
+        str: Description of the grid
+    """
+    image_data = base64.b64decode(base64_image)
+    provider = get_provider()
+    # Gemini descriptions were always capped tighter than OpenAI's
+    max_tokens = 400 if provider.name == "gemini" else 500
+
+    async def describe_grid():
+        return await provider.describe_image(GRID_ANALYSIS_PROMPT, image_data, GRID_MIME_TYPE, max_tokens)
+
+    return await cached_llm_call(
+        "grid_description", f"{provider.name}:{provider.vision_model}", GRID_ANALYSIS_PROMPT,
+        describe_grid, image_data, {"max_tokens": max_tokens})
+
+async def analyze_grid_images(base64_images: List[str], task_id: str = None, grid_groups: List[int] = None) -> Tuple[List[str], bool]:
     """
     Analyze multiple grid images without audio and return their descriptions.
+
+    Grids are described concurrently (at most GRID_ANALYSIS_CONCURRENCY at a
+    time) and reassembled in segment order. A failed grid yields an error
+    placeholder without affecting the others.
     
     Args:
         base64_images (List[str]): List of base64 encoded grid images
         task_id (str, optional): Task identifier for progress tracking
+        grid_groups (List[int], optional): For each original grid, the index of
+            its representative in base64_images; descriptions are expanded back
+            to the original segment order
         
     Returns:
-        List[str]: List of descriptions for each grid
+        Tuple[List[str], bool]: Descriptions for each grid, and whether any
+        grid failed to be described
     """
     try:
-        descriptions = []
         total_images = len(base64_images)
-        
-        for idx, base64_image in enumerate(base64_images, 1):
-            if task_id:
-                progress = int(65 + (idx / total_images * 5))  # Progress from 65% to 70%
-                task_tracker.update_progress(task_id, f"Analyzing grid image {idx}/{total_images}", progress)
-                
+        semaphore = asyncio.Semaphore(settings.GRID_ANALYSIS_CONCURRENCY)
+        completed = 0
+        failed = False
+
+        async def analyze(idx: int, base64_image: str) -> str:
+            nonlocal completed, failed
             try:
-                # Decode the base64 image
-                image_data = base64.b64decode(base64_image)
+                async with semaphore:
+                    description = await _describe_grid(base64_image)
             except Exception as e:
-                logger.warning(f"Error decoding base64 image in grid {idx}: {str(e)}")
-                continue
-            prompt = """
-                Analyze this series of video frames with particular attention to Christian themes and NSFW content:
-
-                Provide a comprehensive description focusing on:
-                1. The speaker's actions and expressions
-                2. Any text overlays or icons and their significance
-                3. Visual elements and their significance
-                4. The overall theme and message visible in these frames
-                5. Number of faces visible
-                6. Gender identification of visible individuals
-                7. Personality traits and demeanor of main individuals
-                8. Notable interactions or expressions
-                9. Visual progression and scene changes
-                10. Any identifiable individuals or notable features
-
-                Focus on visual analysis only. Describe the progression naturally without mentioning grid layout.
-                Write the description only for 10 above points.
-                """
-
-            if openai_model:
-                response = await client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens = 500
-                )
-                descriptions.append(response.choices[0].message.content.strip())
-
-            if gemini_model:
-                response = await client.aio.models.generate_content(
-                                model='gemini-2.0-flash',
-                                contents=[prompt,genai.types.Part.from_bytes(data=image_data, mime_type="image/png")],
-                                config=genai.types.GenerateContentConfig(max_output_tokens= 400))
-                descriptions.append(response.text.strip())
-            
-        return descriptions
+                logger.error(f"Error analyzing grid image {idx}: {str(e)}")
+                description = f"Error analyzing frame grid {idx}"
+                failed = True
+            completed += 1
+            if task_id:
+                progress = int(65 + (completed / total_images * 5))  # Progress from 65% to 70%
+                task_tracker.update_progress(task_id, f"Analyzed grid image {completed}/{total_images}", progress)
+            return description
+
+        descriptions = await asyncio.gather(*[
+            analyze(idx, base64_image) for idx, base64_image in enumerate(base64_images, 1)
+        ])
+
+        if grid_groups is not None:
+            descriptions = [descriptions[group] for group in grid_groups]
+        return [description for description in descriptions if description is not None], failed
     
     except Exception as e:
         error_msg = f"Error in analyzing grid images: {str(e)}"
         logger.error(error_msg)
         if task_id:
             task_tracker.update_progress(task_id, f"Error: {error_msg}", 70)
-        return [error_msg]
+        return [error_msg], True
+
+def _clean_description(provider: LLMProvider, text: str, strip: bool = True) -> str:
+    """Remove Markdown remnants from non-OpenAI descriptions (OpenAI output is kept as is)."""
+    if provider.name != "openai":
+        text = text.replace('```json','').replace('```','')
+    if strip:
+        text = text.strip()
+    if provider.name == "openai":
+        return text
+    return re.sub(r"[\n*\\]", " ", text)
 
-async def generate_description(base64_images: List[str], audio_transcription: str = None, task_id: str = None) -> str:
+async def generate_description(base64_images: List[str], audio_transcription: str = None, task_id: str = None, grid_groups: List[int] = None) -> Tuple[str, bool]:
     """
     Generate a comprehensive video description combining multiple grid analyses and audio transcription.
+
+    With DESCRIPTION_STREAMING enabled the description is streamed to the
+    task's progress subscribers as description_delta events while it is
+    generated, then published in full before this returns.
     
     Args:
         base64_images (List[str]): List of base64 encoded grid images
         audio_transcription (str, optional): Audio transcription text
         task_id (str, optional): Task identifier for progress tracking
+        grid_groups (List[int], optional): Grid group mapping from process_video
         
     Returns:
-        str: Combined comprehensive description
+        Tuple[str, bool]: Combined comprehensive description (an error message
+        on failure), and whether any model call behind it failed
     """
     try:
         # First, analyze all grid images
         if task_id:
             task_tracker.update_progress(task_id, "Starting grid analysis", 65)
             
-        grid_descriptions = await analyze_grid_images(base64_images, task_id)
+        grid_descriptions, grids_failed = await analyze_grid_images(base64_images, task_id, grid_groups)
         
         # Prepare the final analysis prompt
         if task_id:
@@ -152,34 +176,26 @@ async def generate_description(base64_images: List[str], audio_transcription: st
         Provide a natural, flowing narrative that combines all these elements into a coherent analysis.
         """
         
-        if openai_model:
-            response = await client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": final_prompt
-                    }
-                ],
-                max_tokens=1500
-            )
-            
-            if task_id:
-                task_tracker.update_progress(task_id, "Description generation completed", 75)
-                
-            return response.choices[0].message.content.strip()
-        if gemini_model:
-            response = await client.aio.models.generate_content(model='gemini-2.0-flash',contents = f'''user: {final_prompt}, system:''',  config=genai.types.GenerateContentConfig(max_output_tokens= 1500))
-            result = response.text.replace('```json','').replace('```','')
-    
-            if task_id:
-                task_tracker.update_progress(task_id, "Description generation completed", 75)
-            
-            return re.sub(r"[\n*\\]", " ", result.strip())
+        provider = get_provider()
+        if settings.DESCRIPTION_STREAMING and task_id:
+            parts = []
+            async for delta in provider.generate_stream(final_prompt, max_tokens=1500):
+                parts.append(delta)
+                task_tracker.publish(task_id, {"event": "description_delta", "text": _clean_description(provider, delta, strip=False)})
+            result = "".join(parts)
+        else:
+            result = await provider.generate(final_prompt, max_tokens=1500)
+        description = _clean_description(provider, result)
+
+        if task_id:
+            task_tracker.publish(task_id, {"event": "description", "text": description})
+            task_tracker.update_progress(task_id, "Description generation completed", 75)
+
+        return description, grids_failed
         
     except Exception as e:
         error_msg = f"Error in generate_description: {str(e)}"
         logger.error(error_msg)
         if task_id:
             task_tracker.update_progress(task_id, f"Error: {error_msg}", 75)
-        return error_msg
\ No newline at end of file
+        return error_msg, True
\ No newline at end of file
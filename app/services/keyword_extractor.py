@@ -1,19 +1,11 @@
-from app.core.config import settings
 from app.core.logging import logger
+from app.core.llm_cache import cached_llm_call
+from app.services.llm_provider import get_provider
 import json
 
-openai_model = settings.openai_model
-gemini_model = settings.gemini_model
-if gemini_model:
-    from google import genai
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-if openai_model:
-    from openai import AsyncOpenAI
-    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-
 async def extract_video_metadata(description: str, task_id: str = None, duration: str = None,is_safe: bool = None) -> dict:
     """
-    Extract metadata from video description using GPT-4.
+    Extract metadata from video description using the configured text model.
     
     Args:
         description (str): Video description
@@ -70,25 +62,16 @@ async def extract_video_metadata(description: str, task_id: str = None, duration
         Ensure all fields are filled based on the information available in the description. Return the response in valid JSON format with plain text only.
         """
 
-        if openai_model:
-            response = await client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert content analyzer."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1000
-            )
-            
-            # Parse and return the response
-            extracted_metadata = json.loads(response.choices[0].message.content.strip())
+        provider = get_provider()
+        # OpenAI metadata has always been capped at 1000 tokens, Gemini at 1500
+        max_tokens = 1000 if provider.name == "openai" else 1500
 
-        if gemini_model:
-            response = await client.aio.models.generate_content(model='gemini-2.0-flash',contents = f'''system: You are an expert content analyzer., user: {prompt}, system:''',  config=genai.types.GenerateContentConfig(max_output_tokens= 1500, temperature=0.3, response_mime_type= 'application/json'))
-            result = response.text.replace('```json', '').replace('```', '').strip()
-  
-            extracted_metadata = json.loads(result.strip())
+        async def extract_metadata():
+            return await provider.extract_structured(
+                prompt, system="You are an expert content analyzer.", max_tokens=max_tokens, temperature=0.3)
+        extracted_metadata = await cached_llm_call(
+            "metadata", f"{provider.name}:{provider.text_model}", prompt, extract_metadata,
+            config={"max_tokens": max_tokens, "temperature": 0.3})
 
         extracted_metadata["duration_estimate"] = duration
         if extracted_metadata["is_safe"] == True:
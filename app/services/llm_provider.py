@@ -0,0 +1,402 @@
+import asyncio
+import base64
+import hashlib
+import json
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.rate_limiter import call_with_rate_limit
+
+# Moderation categories returned by every provider, "/" replaced by "_"
+MODERATION_CATEGORIES = [
+    "sexual", "sexual_minors", "violence", "violence_graphic", "harassment",
+    "harassment_threatening", "hate", "hate_threatening", "self-harm",
+    "self-harm_intent", "self-harm_instructions", "illicit", "illicit_violent",
+]
+
+# Rough token costs used to charge calls against tokens-per-minute limits
+CHARS_PER_TOKEN = 4
+IMAGE_TOKEN_ESTIMATE = 800
+AUDIO_TOKEN_ESTIMATE = 3000  # one 90 s chunk at ~32 tokens/s
+DEFAULT_OUTPUT_TOKENS = 1000
+
+# OpenAI chat models that reject response_format={"type": "json_object"}; their JSON
+# is requested by the prompt alone and parsed after stripping code fences
+OPENAI_MODELS_WITHOUT_JSON_MODE = {
+    "gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0314", "gpt-4-32k-0613",
+    "gpt-3.5-turbo-0301", "gpt-3.5-turbo-0613", "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613",
+}
+
+def estimate_tokens(prompt: str, max_tokens: Optional[int] = None, images: int = 0, audio_clips: int = 0) -> int:
+    """Estimate the prompt plus completion tokens a call will be charged."""
+    return (
+        len(prompt) // CHARS_PER_TOKEN
+        + images * IMAGE_TOKEN_ESTIMATE
+        + audio_clips * AUDIO_TOKEN_ESTIMATE
+        + (max_tokens or DEFAULT_OUTPUT_TOKENS)
+    )
+
+def _strip_json_fences(text: str) -> str:
+    """Remove Markdown code fences models sometimes wrap JSON in."""
+    return text.replace('```json', '').replace('```', '').strip()
+
+def _http_limits() -> httpx.Limits:
+    """Connection pool limits shared by every provider client."""
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+class LLMProvider:
+    """
+    Provider-neutral interface to the models used by the pipeline.
+
+    One instance is created per process and reused by every task, so all
+    calls share the same keep-alive connection pool. Every request goes
+    through the process-wide rate limiter for its provider and model.
+    """
+
+    name = "base"
+    vision_model = ""
+    text_model = ""
+    transcription_model = ""
+    moderation_model = ""
+    # Most images accepted by a single moderate() call
+    max_moderation_images = 1
+
+    async def describe_image(self, prompt: str, image_data: bytes, mime_type: str, max_tokens: int) -> str:
+        """Describe an image according to prompt."""
+        raise NotImplementedError
+
+    async def transcribe(self, prompt: str, audio_data: bytes, mime_type: str) -> str:
+        """Transcribe an audio clip to text."""
+        raise NotImplementedError
+
+    async def moderate(self, prompt: str, images: List[bytes], mime_type: str) -> List[Dict]:
+        """Return one moderation score dict per image, in order."""
+        raise NotImplementedError
+
+    async def generate(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                       temperature: Optional[float] = None, json_output: bool = False) -> str:
+        """Generate text from a prompt."""
+        raise NotImplementedError
+
+    async def generate_stream(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                              temperature: Optional[float] = None) -> AsyncIterator[str]:
+        """Generate text from a prompt, yielding it in pieces as the model produces them."""
+        yield await self.generate(prompt, system, max_tokens, temperature)
+
+    async def extract_structured(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                                 temperature: Optional[float] = None) -> Dict:
+        """Generate a JSON object from a prompt."""
+        return json.loads(_strip_json_fences(
+            await self.generate(prompt, system, max_tokens, temperature, json_output=True)
+        ))
+
+    async def aclose(self):
+        """Close pooled connections."""
+
+    async def _limited(self, model: str, tokens: int, call, timeout: Optional[float] = None):
+        """Make one request under the rate limiter for this provider's model."""
+        return await call_with_rate_limit(f"{self.name}:{model}", tokens, call, timeout)
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini models through google-genai."""
+
+    name = "gemini"
+    max_moderation_images = 16
+
+    def __init__(self):
+        from google import genai
+        self.genai = genai
+        self.vision_model = self.text_model = self.transcription_model = self.moderation_model = settings.GEMINI_MODEL
+        try:
+            http_options = genai.types.HttpOptions(
+                timeout=int(settings.LLM_TIMEOUT_SECONDS * 1000),
+                async_client_args={"limits": _http_limits()},
+            )
+            self.client = genai.Client(api_key=settings.GEMINI_API_KEY, http_options=http_options)
+        except Exception as e:
+            logger.warning(f"Gemini client does not accept pool options, using defaults: {str(e)}")
+            self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
+
+    async def describe_image(self, prompt: str, image_data: bytes, mime_type: str, max_tokens: int) -> str:
+        response = await self._limited(self.vision_model, estimate_tokens(prompt, max_tokens, images=1), lambda: self.client.aio.models.generate_content(
+            model=self.vision_model,
+            contents=[prompt, self.genai.types.Part.from_bytes(data=image_data, mime_type=mime_type)],
+            config=self.genai.types.GenerateContentConfig(max_output_tokens=max_tokens),
+        ))
+        return response.text.strip()
+
+    async def transcribe(self, prompt: str, audio_data: bytes, mime_type: str) -> str:
+        response = await self._limited(self.transcription_model, estimate_tokens(prompt, audio_clips=1), lambda: self.client.aio.models.generate_content(
+            model=self.transcription_model,
+            contents=[prompt, self.genai.types.Part.from_bytes(data=audio_data, mime_type=mime_type)],
+        ))
+        return response.text.strip()
+
+    async def moderate(self, prompt: str, images: List[bytes], mime_type: str) -> List[Dict]:
+        contents = [prompt]
+        if len(images) == 1:
+            contents.append(self.genai.types.Part.from_bytes(data=images[0], mime_type=mime_type))
+        else:
+            for idx, image_data in enumerate(images, 1):
+                contents.append(f"Image {idx}:")
+                contents.append(self.genai.types.Part.from_bytes(data=image_data, mime_type=mime_type))
+        response = await self._limited(self.moderation_model, estimate_tokens(prompt, images=len(images)), lambda: self.client.aio.models.generate_content(
+            model=self.moderation_model,
+            contents=contents,
+            config=self.genai.types.GenerateContentConfig(response_mime_type='application/json'),
+        ), timeout=settings.MODERATION_TIMEOUT_SECONDS)
+        results = json.loads(_strip_json_fences(response.text))
+        return results if isinstance(results, list) else [results]
+
+    async def generate(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                       temperature: Optional[float] = None, json_output: bool = False) -> str:
+        contents = f"system: {system}, user: {prompt}, system:" if system else f"user: {prompt}, system:"
+        response = await self._limited(self.text_model, estimate_tokens(contents, max_tokens), lambda: self.client.aio.models.generate_content(
+            model=self.text_model,
+            contents=contents,
+            config=self.genai.types.GenerateContentConfig(
+                max_output_tokens=max_tokens,
+                temperature=temperature,
+                response_mime_type='application/json' if json_output else None,
+            ),
+        ))
+        return response.text
+
+    async def generate_stream(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                              temperature: Optional[float] = None) -> AsyncIterator[str]:
+        contents = f"system: {system}, user: {prompt}, system:" if system else f"user: {prompt}, system:"
+        stream = await self._limited(self.text_model, estimate_tokens(contents, max_tokens), lambda: self.client.aio.models.generate_content_stream(
+            model=self.text_model,
+            contents=contents,
+            config=self.genai.types.GenerateContentConfig(max_output_tokens=max_tokens, temperature=temperature),
+        ))
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    async def aclose(self):
+        # google-genai has no async close; its pooled httpx client lives on the API client
+        http_client = getattr(self.client._api_client, "_async_httpx_client", None)
+        if http_client is not None:
+            await http_client.aclose()
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI models through the openai SDK."""
+
+    name = "openai"
+    # omni-moderation accepts a single image per request
+    max_moderation_images = 1
+
+    def __init__(self):
+        from openai import AsyncOpenAI
+        self.vision_model = settings.OPENAI_VISION_MODEL
+        self.text_model = settings.OPENAI_TEXT_MODEL
+        self.transcription_model = settings.OPENAI_TRANSCRIPTION_MODEL
+        self.moderation_model = settings.OPENAI_MODERATION_MODEL
+        self.http_client = httpx.AsyncClient(limits=_http_limits(), timeout=settings.LLM_TIMEOUT_SECONDS)
+        # Retries are left to the rate limiter so backoff is shared across tasks
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=self.http_client, max_retries=0)
+
+    async def describe_image(self, prompt: str, image_data: bytes, mime_type: str, max_tokens: int) -> str:
+        response = await self._limited(self.vision_model, estimate_tokens(prompt, max_tokens, images=1), lambda: self.client.chat.completions.create(
+            model=self.vision_model,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{base64.b64encode(image_data).decode('utf-8')}"
+                        }
+                    }
+                ]
+            }],
+            max_tokens=max_tokens,
+        ))
+        return response.choices[0].message.content.strip()
+
+    async def transcribe(self, prompt: str, audio_data: bytes, mime_type: str) -> str:
+        extension = mime_type.split('/')[-1]
+        response = await self._limited(self.transcription_model, estimate_tokens(prompt, audio_clips=1), lambda: self.client.audio.transcriptions.create(
+            model=self.transcription_model,
+            file=(f"audio.{extension}", audio_data, mime_type),
+        ))
+        return response.text.strip()
+
+    async def moderate(self, prompt: str, images: List[bytes], mime_type: str) -> List[Dict]:
+        response = await self._limited(self.moderation_model, estimate_tokens("", 0, images=len(images)), lambda: self.client.moderations.create(
+            model=self.moderation_model,
+            input=[{
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{mime_type};base64,{base64.b64encode(image_data).decode('utf-8')}"
+                }
+            } for image_data in images],
+        ), timeout=settings.MODERATION_TIMEOUT_SECONDS)
+        results = []
+        for result in response.results:
+            scores = result.category_scores.model_dump(by_alias=True)
+            flat = {category.replace('/', '_'): score for category, score in scores.items()}
+            flat["flagged"] = result.flagged
+            results.append(flat)
+        return results
+
+    async def generate(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                       temperature: Optional[float] = None, json_output: bool = False) -> str:
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        kwargs = {}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        if json_output and self.text_model not in OPENAI_MODELS_WITHOUT_JSON_MODE:
+            kwargs["response_format"] = {"type": "json_object"}
+        response = await self._limited(
+            self.text_model, estimate_tokens(f"{system or ''}{prompt}", max_tokens),
+            lambda: self.client.chat.completions.create(model=self.text_model, messages=messages, **kwargs),
+        )
+        return response.choices[0].message.content
+
+    async def generate_stream(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                              temperature: Optional[float] = None) -> AsyncIterator[str]:
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": prompt})
+        kwargs = {}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+        stream = await self._limited(
+            self.text_model, estimate_tokens(f"{system or ''}{prompt}", max_tokens),
+            lambda: self.client.chat.completions.create(model=self.text_model, messages=messages, stream=True, **kwargs),
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aclose(self):
+        await self.client.close()
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline provider for tests and throughput measurement.
+
+    Responses are derived from a hash of the inputs, and every call sleeps
+    for LLM_FAKE_LATENCY_MS to stand in for network latency.
+    """
+
+    name = "fake"
+    vision_model = text_model = transcription_model = moderation_model = "fake-model"
+    max_moderation_images = 16
+
+    @staticmethod
+    def _digest(*parts) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else str(part).encode())
+        return digest.hexdigest()[:12]
+
+    async def _latency(self, tokens: int, timeout: Optional[float] = None):
+        async def respond():
+            if settings.LLM_FAKE_LATENCY_MS:
+                await asyncio.sleep(settings.LLM_FAKE_LATENCY_MS / 1000)
+        await self._limited(self.text_model, tokens, respond, timeout)
+
+    async def describe_image(self, prompt: str, image_data: bytes, mime_type: str, max_tokens: int) -> str:
+        await self._latency(estimate_tokens(prompt, max_tokens, images=1))
+        return f"Fake description {self._digest(prompt, image_data)} of a {len(image_data)} byte {mime_type} image."
+
+    async def transcribe(self, prompt: str, audio_data: bytes, mime_type: str) -> str:
+        await self._latency(estimate_tokens(prompt, audio_clips=1))
+        return f"Fake transcript {self._digest(prompt, audio_data)}."
+
+    async def moderate(self, prompt: str, images: List[bytes], mime_type: str) -> List[Dict]:
+        await self._latency(estimate_tokens(prompt, images=len(images)), settings.MODERATION_TIMEOUT_SECONDS)
+        return [dict({category: 0.0 for category in MODERATION_CATEGORIES}, flagged=False) for _ in images]
+
+    async def generate(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                       temperature: Optional[float] = None, json_output: bool = False) -> str:
+        await self._latency(estimate_tokens(f"{system or ''}{prompt}", max_tokens))
+        digest = self._digest(system, prompt)
+        if not json_output:
+            return f"Fake generated text {digest}."
+        return json.dumps({
+            "description": f"Fake description {digest}",
+            "keywords": [{"keyword": f"keyword{i}", "weight": 10 - i} for i in range(5)],
+            "topics": ["fake topic"],
+            "entities": [],
+            "actions": [],
+            "emotions": [],
+            "visual_elements": [],
+            "audio_elements": [],
+            "genre": "fake",
+            "target_audience": [],
+            "duration_estimate": "0:00",
+            "quality_indicators": [],
+            "unique_identifiers": [digest],
+            "is_face_exist": False,
+            "person_identity": {"name": "", "gender": ""},
+            "other_person_identity": [],
+            "psychological_personality": [],
+            "no_of_person_in_video": 0,
+            "content_warnings": [],
+            "safety_analysis": [],
+            "is_safe": True,
+            "warnings": [],
+            "reason": "",
+        })
+
+    async def generate_stream(self, prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+                              temperature: Optional[float] = None) -> AsyncIterator[str]:
+        text = await self.generate(prompt, system, max_tokens, temperature)
+        for word in text.split(" "):
+            yield f"{word} "
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "openai": OpenAIProvider,
+    "fake": FakeProvider,
+}
+
+_providers: Dict[str, LLMProvider] = {}
+
+def _provider(name: str) -> LLMProvider:
+    if name not in _providers:
+        _providers[name] = PROVIDERS[name]()
+        logger.info(f"Initialised {name} LLM provider")
+    return _providers[name]
+
+def get_provider() -> LLMProvider:
+    """
+    Return the shared provider for description, transcription and extraction.
+
+    LLM_PROVIDER selects it explicitly; otherwise the legacy openai_model and
+    gemini_model flags are honoured, with OpenAI taking precedence when both are set.
+    """
+    if settings.LLM_PROVIDER:
+        return _provider(settings.LLM_PROVIDER.lower())
+    return _provider("openai" if settings.openai_model else "gemini")
+
+def get_moderation_provider() -> LLMProvider:
+    """Return the shared provider for image moderation."""
+    if settings.omni_moderation_model and (settings.LLM_PROVIDER or "").lower() != "fake":
+        return _provider("openai")
+    return get_provider()
+
+async def close_providers():
+    """Close every provider's connection pool."""
+    for provider in list(_providers.values()):
+        try:
+            await provider.aclose()
+        except Exception as e:
+            logger.error(f"Error closing {provider.name} provider: {str(e)}")
+    _providers.clear()
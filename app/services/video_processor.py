@@ -1,67 +1,217 @@
 import cv2
 import numpy as np
-from PIL import Image
-import io
 import base64
 from app.core.logging import logger
 from datetime import datetime
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, List, Set, Tuple, Optional
 from app.core.config import settings
 import asyncio
-from collections import defaultdict
-import tempfile
-import os
+from cachetools import TTLCache
+import time
 from app.core.task_tracker import task_tracker
-import json
+from app.core.executors import run_cpu, run_io
+from app.core.llm_cache import cached_llm_call
+from app.services.llm_provider import LLMProvider, get_moderation_provider
 
 
-openai_model = settings.openai_model
-gemini_model = settings.gemini_model
-omni_moderation_model = settings.omni_moderation_model
-# print(f"OpenAI Model: {openai_model}, Gemini Model: {gemini_model}, Omni Moderation Model: {omni_moderation_model}")
-if gemini_model:
-    from google import genai
-    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-    # print(client)
-if openai_model:
-    from openai import AsyncOpenAI
-    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+# Per-task video processing summaries, kept for TASK_STATE_TTL_SECONDS
+task_queue: Dict[str, Dict] = TTLCache(maxsize=settings.TASK_STATE_MAX_FINISHED, ttl=settings.TASK_STATE_TTL_SECONDS)
 
-# Task queue to store processing results
-task_queue: Dict[str, Dict] = defaultdict(dict)
+# Number of frames tiled into each grid image (4x4)
+FRAMES_PER_GRID = 16
+GRID_COLUMNS = 4
 
-async def split_video(video_content: bytes, task_id: str) -> List[bytes]:
+# Grid encodings: file extension, MIME type and cv2 quality flag
+GRID_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", "image/png", None),
+}
+GRID_EXTENSION, GRID_MIME_TYPE, _GRID_QUALITY_FLAG = GRID_FORMATS[settings.GRID_FORMAT.lower()]
+
+# Thumbnail size used to compare candidate frames in scene selection mode
+SCENE_THUMBNAIL_SIZE = (32, 18)
+# Mean thumbnail distance (0-1) below which a candidate only repeats a chosen frame
+SCENE_MIN_DISTANCE = 2 / 255
+
+def _tile_size(width: int, height: int, max_pixels: int) -> Tuple[int, int]:
+    """
+    Return the tile size that keeps a 4x4 grid of frames within max_pixels.
+
+    Frames are never upscaled.
+    """
+    scale = min(1.0, (max_pixels / (FRAMES_PER_GRID * width * height)) ** 0.5)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def _build_grid(frames: List[np.ndarray], tile_w: int, tile_h: int) -> np.ndarray:
+    """
+    Tile frames into a 4x4 grid.
+
+    Frames not already at the tile size are downsampled with cv2, then all
+    tiles are stacked and arranged with a single reshape; missing frames
+    are left black.
+
+    Args:
+        frames (List[np.ndarray]): Up to FRAMES_PER_GRID BGR frames
+        tile_w (int): Tile width in pixels
+        tile_h (int): Tile height in pixels
+
+    Returns:
+        np.ndarray: BGR grid image
+    """
+    rows = FRAMES_PER_GRID // GRID_COLUMNS
+    tiles = np.zeros((FRAMES_PER_GRID, tile_h, tile_w, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames[:FRAMES_PER_GRID]):
+        if frame.shape[:2] != (tile_h, tile_w):
+            frame = cv2.resize(frame, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+        tiles[i] = frame
+
+    return (
+        tiles.reshape(rows, GRID_COLUMNS, tile_h, tile_w, 3)
+        .transpose(0, 2, 1, 3, 4)
+        .reshape(rows * tile_h, GRID_COLUMNS * tile_w, 3)
+    )
+
+def _select_keyframes(frames: List[np.ndarray], count: int) -> List[int]:
+    """
+    Pick the most mutually distinct frames from a list of candidates.
+
+    Each candidate is reduced to a small grayscale thumbnail and frames are
+    chosen greedily by farthest-point selection: every pick maximises its
+    mean absolute pixel distance to the frames already chosen. The first
+    candidate is always kept so each part opens on its first shot. Once the
+    remaining candidates only repeat chosen frames (static shots), the
+    leftover slots are filled with evenly spaced unchosen candidates, so
+    exactly count distinct frames are always returned.
+
+    Args:
+        frames (List[np.ndarray]): Candidate BGR frames in time order
+        count (int): Number of keyframes to pick
+
+    Returns:
+        List[int]: Positions of the chosen frames in time order
+    """
+    if len(frames) <= count:
+        return list(range(len(frames)))
+
+    features = np.stack([
+        cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), SCENE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        for frame in frames
+    ]).reshape(len(frames), -1).astype(np.float32) / 255.0
+
+    selected = [0]
+    min_distance = np.abs(features - features[0]).mean(axis=1)
+    min_distance[0] = -np.inf
+    for _ in range(count - 1):
+        candidate = int(np.argmax(min_distance))
+        if min_distance[candidate] < SCENE_MIN_DISTANCE:
+            break
+        selected.append(candidate)
+        min_distance = np.minimum(min_distance, np.abs(features - features[candidate]).mean(axis=1))
+        min_distance[candidate] = -np.inf
+
+    remaining = count - len(selected)
+    if remaining:
+        chosen = set(selected)
+        unselected = [i for i in range(len(frames)) if i not in chosen]
+        spacing = len(unselected) / remaining
+        selected.extend(unselected[int((slot + 0.5) * spacing)] for slot in range(remaining))
+
+    return sorted(selected)
+
+def _encode_grid(grid: np.ndarray) -> bytes:
+    """Encode a BGR grid in the configured GRID_FORMAT."""
+    params = [_GRID_QUALITY_FLAG, settings.GRID_QUALITY] if _GRID_QUALITY_FLAG is not None else []
+    ok, encoded = cv2.imencode(GRID_EXTENSION, grid, params)
+    if not ok:
+        raise ValueError(f"Could not encode grid as {settings.GRID_FORMAT}")
+    return encoded.tobytes()
+
+def _part_frame_indices(start_frame: int, end_frame: int, count: int = FRAMES_PER_GRID) -> List[int]:
+    """
+    Return the frame indices extract_frames samples from a part.
+
+    Args:
+        start_frame (int): First frame of the part (inclusive)
+        end_frame (int): Last frame of the part (exclusive)
+        count (int): Number of indices to return
+
+    Returns:
+        List[int]: Evenly spaced frame indices within the part
+    """
+    part_frames = max(1, end_frame - start_frame)
+    interval = max(1, part_frames // count)
+    return [start_frame + min(i * interval, part_frames - 1) for i in range(count)]
+
+def _sample_frames_sequential(video: cv2.VideoCapture, frame_indices: List[int], start_frame: int = 0, transform: Callable[[np.ndarray], np.ndarray] = None) -> Tuple[Dict[int, np.ndarray], int]:
+    """
+    Decode the wanted frames in a single forward pass over the video.
+
+    Frames that are not needed are skipped with grab(), which demuxes and
+    decodes without the colour conversion and copy done by retrieve(), so
+    the container is never seeked and each GOP is decoded only once.
+
+    Args:
+        video (cv2.VideoCapture): Opened capture positioned at start_frame
+        frame_indices (List[int]): Frame indices to keep
+        start_frame (int): Frame index the capture is currently positioned at
+        transform (Callable, optional): Applied to each kept frame as it is retrieved
+
+    Returns:
+        Tuple[Dict[int, np.ndarray], int]: Frames keyed by index and the number of frames decoded
+    """
+    wanted = sorted(set(frame_indices))
+    frames: Dict[int, np.ndarray] = {}
+    frame_idx = start_frame
+    for target in wanted:
+        while frame_idx <= target:
+            if not video.grab():
+                return frames, frame_idx - start_frame
+            frame_idx += 1
+        ret, frame = video.retrieve()
+        if ret:
+            frames[target] = transform(frame) if transform else frame
+        else:
+            logger.warning(f"Failed to retrieve frame at position {target}")
+    return frames, frame_idx - start_frame
+
+def _probe_video(video_path: str) -> Tuple[int, float]:
+    """
+    Read the frame count and frame rate of a video file.
+
+    Args:
+        video_path (str): Path to the source video file
+
+    Returns:
+        Tuple[int, float]: Total frames and frames per second
+    """
+    video = cv2.VideoCapture(video_path)
+    try:
+        if not video.isOpened():
+            raise ValueError(f"Could not open video content from {video_path}")
+        return int(video.get(cv2.CAP_PROP_FRAME_COUNT)), video.get(cv2.CAP_PROP_FPS)
+    finally:
+        video.release()
+
+async def split_video(video_path: str, task_id: str) -> Tuple[List[Dict], float]:
     """
     Split video into parts based on duration.
+
+    Parts are virtual: each one is a frame range over the source file, so
+    nothing is re-encoded or copied and extract_frames reads the range
+    straight from the source.
     
     Args:
-        video_content (bytes): Raw video content
+        video_path (str): Path to the source video file
         task_id (str): Unique task identifier
         
     Returns:
-        List[bytes]: List of video chunks in memory
+        Tuple[List[Dict], float]: Segment descriptors and the video duration in seconds
     """
-    temp_input_file = None
-    temp_output_file = None
     try:
-        task_tracker.update_progress(task_id, "Saving video to temporary file", 6)
-        # First, save the input video content to a temporary file
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            temp_file.write(video_content)
-            temp_input_file = temp_file.name
-        
         task_tracker.update_progress(task_id, "Opening video file", 7)
-        # Open video from the temporary file
-        video = cv2.VideoCapture(temp_input_file)
-        if not video.isOpened():
-            raise ValueError(f"Could not open video content from {temp_input_file}")
-        
-        # Get video properties
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        fps = video.get(cv2.CAP_PROP_FPS)
+        total_frames, fps = await run_io(_probe_video, video_path)
         duration = total_frames / fps if fps > 0 else 0
-        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
         task_tracker.update_progress(task_id, "Calculating video parts", 8)
         # Calculate number of parts (max 5)
@@ -71,275 +221,382 @@ async def split_video(video_content: bytes, task_id: str) -> List[bytes]:
         
         logger.info(f"Video properties: {total_frames} frames, {fps} FPS, Duration: {duration:.2f} seconds")
         logger.info(f"Splitting into {num_parts} parts, {frames_per_part} frames per part")
-        
-        # Split video into parts
-        video_parts = []
-        progress_per_part = 7 / num_parts  # 7% progress allocated for splitting
-        
+
+        segments = []
         for i in range(num_parts):
-            task_tracker.update_progress(task_id, f"Processing video part {i+1}/{num_parts}", 8 + (i * progress_per_part))
-            
-            # Create temporary file for output chunk
-            with tempfile.NamedTemporaryFile(suffix=f'_part_{i}.mp4', delete=False) as out_file:
-                temp_output_file = out_file.name
-            
-            # Create VideoWriter object
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            writer = cv2.VideoWriter(
-                temp_output_file,
-                fourcc,
-                fps,
-                (width, height)
-            )
-            
             start_frame = i * frames_per_part
             end_frame = start_frame + frames_per_part if i < num_parts - 1 else total_frames
-            
-            logger.info(f"Processing part {i+1}: frames {start_frame} to {end_frame}")
-            
-            for frame_idx in range(int(start_frame), int(end_frame)):
-                video.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = video.read()
-                if ret:
-                    writer.write(frame)
-            
-            writer.release()
-            
-            # Read the chunk back and append to list
-            with open(temp_output_file, 'rb') as f:
-                video_parts.append(f.read())
-            
-            # Clean up output file
-            os.unlink(temp_output_file)
+            logger.info(f"Part {i+1}: frames {start_frame} to {end_frame}")
+            segments.append({
+                "index": i,
+                "start_frame": start_frame,
+                "end_frame": end_frame,
+                "start_time": start_frame / fps if fps > 0 else 0.0,
+                "end_time": end_frame / fps if fps > 0 else 0.0,
+            })
         
         task_tracker.update_progress(task_id, "Video splitting completed", 15)
-        return video_parts, duration
+        return segments, duration
         
     except Exception as e:
         logger.error(f"Error in split_video: {str(e)}")
         raise
-    
-    finally:
-        if 'video' in locals():
-            video.release()
-        # Clean up temporary files
-        if temp_input_file and os.path.exists(temp_input_file):
-            try:
-                os.unlink(temp_input_file)
-            except Exception as e:
-                logger.error(f"Error deleting temporary input file: {str(e)}")
-        if temp_output_file and os.path.exists(temp_output_file):
-            try:
-                os.unlink(temp_output_file)
-            except Exception as e:
-                logger.error(f"Error deleting temporary output file: {str(e)}")
 
-async def extract_frames(video_chunk: bytes) -> str:
+def _extract_grid(video_path: str, segment: Dict) -> Tuple[Optional[str], Dict]:
     """
-    Extract frames from a video chunk and create a grid visualization.
-    
+    Decode a segment's sampled frames and encode them as a grid image.
+
+    Runs in the process pool, so it only takes and returns plain data and
+    leaves progress and metric reporting to the caller.
+
     Args:
-        video_chunk (bytes): Video chunk content
-        
+        video_path (str): Path to the source video file
+        segment (Dict): Segment descriptor produced by split_video
+
     Returns:
-        str: Base64 encoded grid image
+        Tuple[Optional[str], Dict]: Base64 grid (None if no frames) and decode/encode stats
     """
-    temp_file = None
+    video = cv2.VideoCapture(video_path)
     try:
-        # Save video chunk to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp:
-            temp.write(video_chunk)
-            temp_file = temp.name
-        
-        # Open video from temporary file
-        video = cv2.VideoCapture(temp_file)
         if not video.isOpened():
-            raise ValueError(f"Could not open video chunk from {temp_file}")
+            raise ValueError(f"Could not open video from {video_path}")
         
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total_frames == 0:
-            raise ValueError("Video chunk contains no frames")
-            
-        interval = max(1, total_frames // 16)
-        logger.info(f"Extracting frames from chunk: {total_frames} total frames, interval {interval}")
+        start_frame = segment["start_frame"]
+        end_frame = segment["end_frame"]
+        if end_frame <= start_frame:
+            raise ValueError("Video segment contains no frames")
+
+        scene_mode = settings.FRAME_SELECTION.lower() == "scene"
+        candidate_count = max(FRAMES_PER_GRID, settings.SCENE_CANDIDATES_PER_GRID) if scene_mode else FRAMES_PER_GRID
+        frame_indices = _part_frame_indices(start_frame, end_frame, candidate_count)
+        logger.info(f"Extracting frames from segment {segment['index'] + 1}: frames {start_frame} to {end_frame}")
+
+        # Downsample frames to the grid tile size as they are decoded
+        tile_size = {}
+        def to_tile(frame: np.ndarray) -> np.ndarray:
+            if not tile_size:
+                tile_size["w"], tile_size["h"] = _tile_size(frame.shape[1], frame.shape[0], settings.GRID_MAX_PIXELS)
+            if frame.shape[:2] == (tile_size["h"], tile_size["w"]):
+                return frame
+            return cv2.resize(frame, (tile_size["w"], tile_size["h"]), interpolation=cv2.INTER_AREA)
+
+        # One seek to the segment start, then a forward pass over the range
+        if start_frame > 0:
+            video.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        decode_start = time.perf_counter()
+        sampled_frames, frames_decoded = _sample_frames_sequential(video, frame_indices, start_frame, to_tile)
+        decode_seconds = time.perf_counter() - decode_start
+        stats = {
+            "frames_decoded": frames_decoded,
+            "decode_fps": round(frames_decoded / decode_seconds, 1) if decode_seconds > 0 else 0.0,
+            "frame_selection": "scene" if scene_mode else "uniform",
+        }
         
-        frames = []
-        for i in range(16):
-            frame_pos = min(i * interval, total_frames - 1)  # Ensure we don't exceed total frames
-            video.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
-            ret, frame = video.read()
-            if ret:
-                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            else:
-                logger.warning(f"Failed to read frame at position {frame_pos}")
+        if scene_mode:
+            candidates = [sampled_frames[idx] for idx in sorted(sampled_frames)]
+            frames = [candidates[i] for i in _select_keyframes(candidates, FRAMES_PER_GRID)]
+            stats["candidates"] = len(candidates)
+        else:
+            frames = []
+            for frame_pos in frame_indices:
+                frame = sampled_frames.get(frame_pos)
+                if frame is not None:
+                    frames.append(frame)
+                else:
+                    logger.warning(f"Failed to read frame at position {frame_pos}")
         
         if not frames:
-            logger.warning("No frames were extracted from the video chunk")
-            return None
+            logger.warning("No frames were extracted from the video segment")
+            return None, stats
             
         logger.info(f"Successfully extracted {len(frames)} frames")
         
-        # Create grid image
-        grid = Image.new('RGB', (frames[0].shape[1] * 4, frames[0].shape[0] * 4))
-        for i, frame in enumerate(frames):
-            img = Image.fromarray(frame)
-            x_position = (i % 4) * frames[0].shape[1]
-            y_position = (i // 4) * frames[0].shape[0]
-            grid.paste(img, (x_position, y_position))
+        encode_start = time.perf_counter()
+        grid = _build_grid(frames, tile_size["w"], tile_size["h"])
+        encoded = _encode_grid(grid)
+        grid_base64 = base64.b64encode(encoded).decode('utf-8')
+        stats.update({
+            "grid_width": grid.shape[1],
+            "grid_height": grid.shape[0],
+            "grid_format": settings.GRID_FORMAT.lower(),
+            "encode_seconds": round(time.perf_counter() - encode_start, 3),
+            "grid_bytes": len(encoded),
+            "upload_bytes": len(grid_base64),
+        })
+        return grid_base64, stats
+
+    finally:
+        video.release()
+
+async def extract_frames(video_path: str, segment: Dict, task_id: str = None) -> str:
+    """
+    Extract frames from a video segment and create a grid visualization.
+
+    Decoding and encoding run in the process pool so segments are processed
+    in parallel and the event loop stays free.
+    
+    Args:
+        video_path (str): Path to the source video file
+        segment (Dict): Segment descriptor produced by split_video
+        task_id (str, optional): Task identifier for metric reporting
         
-        # Convert to base64
-        buffer = io.BytesIO()
-        grid.save(buffer, format='PNG')
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    Returns:
+        str: Base64 encoded grid image
+    """
+    try:
+        grid, stats = await run_cpu(_extract_grid, video_path, segment)
+        logger.info(f"Segment {segment['index'] + 1} grid stats: {stats}")
+        if task_id:
+            task_tracker.record_metric(task_id, f"grid_part_{segment['index'] + 1}", stats)
+        return grid
     
     except Exception as e:
         logger.error(f"Error in extract_frames: {str(e)}")
         return None
-        
-    finally:
-        if 'video' in locals():
-            video.release()
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.unlink(temp_file)
-            except Exception as e:
-                logger.error(f"Error deleting temporary file: {str(e)}")
 
-async def check_content_moderation(base64_images: List[str]) -> Tuple[bool, List[str]]:
+# Ultra-strict thresholds for different categories
+MODERATION_THRESHOLDS = {
+    'sexual': 0.25,            # 25%
+    'sexual/minors': 0.25,   # 25%
+    'violence': 0.25,         # 25%
+    'violence/graphic': 0.25,  # 25%
+    'harassment': 0.25,       # 25%
+    'harassment/threatening': 0.25,  # 25%
+    'hate': 0.25,            # 25%
+    'hate/threatening': 0.25,  # 25%
+    'self-harm': 0.25,        # 25%
+    'self-harm/intent': 0.25,  # 25%
+    'self-harm/instructions': 0.25,  # 25%
+    'illicit': 0.25,         # 25%
+    'illicit/violent': 0.25    # 25%
+}
+
+MODERATION_PROMPT = """
+    Analyze this image with strict criteria to detect only explicit and definitive instances of harmful or sensitive content. Provide confidence scores ONLY if there is CLEAR and DIRECT evidence of the following categories:
+
+    - Sexual content (explicit nudity, sexual acts, etc.)
+    - Violence (physical harm, graphic violence, weapons used in harmful contexts, etc.)
+    - Harassment (direct threats, aggressive behavior, etc.)
+    - Hate speech (explicit discriminatory language targeting race, religion, gender, etc.)
+    - Self-harm (clear intent or instructions for self-harm)
+    - Illicit activities (illegal actions such as drug use, theft, or violent crimes)
+
+    DO NOT generate a "flagged" value of true unless there is definitive evidence in the image for at least one category. Avoid detecting violence or other categories in neutral or non-threatening scenarios (e.g., people walking, sports, casual interactions).
+
+    Return a JSON object with confidence scores (0.0 to 1.0) for each category AND a "flagged" boolean that is TRUE ONLY if the content violates the above criteria:
+
+    {
+        "sexual": float,
+        "sexual_minors": float,
+        "violence": float,
+        "violence_graphic": float,
+        "harassment": float,
+        "harassment_threatening": float,
+        "hate": float,
+        "hate_threatening": float,
+        "self_harm": float,
+        "self_harm_intent": float,
+        "self_harm_instructions": float,
+        "illicit": float,
+        "illicit_violent": float,
+        "flagged": bool
+    }
+
+    Only return the JSON object with the above keys and values. Do not include any additional text or explanations.
+    """
+
+def _score_moderation_result(result: Dict) -> Tuple[bool, List[str]]:
+    """Apply MODERATION_THRESHOLDS to one image's moderation scores."""
+    is_safe = True
+    warnings = []
+
+    # Check if content is flagged by any category
+    if result.get('flagged', False):
+        is_safe = False
+        warnings.append("SYSTEM FLAG - Content flagged by moderation system")
+
+    # Check all categories with their specific thresholds
+    for category, threshold in MODERATION_THRESHOLDS.items():
+        # Get score safely using .get() for dictionary access
+        score = result.get(category.replace('/', '_'), 0.0)
+
+        if not isinstance(score, (int, float)):
+            continue
+
+        display_category = category.replace('/', ' - ').title()
+
+        if score >= threshold:
+            is_safe = False
+            if score > 0.7:
+                severity = "CRITICAL"
+            elif score > 0.4:
+                severity = "HIGH"
+            elif score > 0.2:
+                severity = "MEDIUM"
+            else:
+                severity = "LOW"
+            warnings.append(f"{severity} RISK - {display_category} detected (confidence: {score:.1%})")
+
+    return is_safe, warnings
+
+# {count} is filled in with str.replace, since MODERATION_PROMPT contains literal JSON braces
+MODERATION_BATCH_PROMPT = """
+    You will receive {count} images, each preceded by a label "Image N:".
+    Moderate each image independently using the criteria below and return a JSON array with exactly {count} objects,
+    one per image in the order given, each using the JSON format described.
+    """ + MODERATION_PROMPT
+
+class ModerationBatcher:
+    """
+    Collects moderation requests from every task into provider-sized batches.
+
+    Requests arriving within the batching window are packed together, up to
+    the provider's per-request image limit, and each caller receives the
+    scores for its own image.
+    """
+
+    def __init__(self, provider: LLMProvider, max_images: int, window_seconds: float, concurrency: int):
+        self.provider = provider
+        self.max_images = max(1, max_images)
+        self.window_seconds = window_seconds
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.worker: Optional[asyncio.Task] = None
+        # In-flight sends, referenced so they are not garbage collected mid-request
+        self.senders: Set[asyncio.Task] = set()
+        self.requests_sent = 0
+
+    async def submit(self, image_data: bytes) -> Dict:
+        """Queue one image and wait for its moderation scores."""
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image_data, future))
+        return await future
+
+    async def _run(self):
+        """Drain the queue into batches and send each one."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window_seconds
+            while len(batch) < self.max_images:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            sender = asyncio.create_task(self._send(batch))
+            self.senders.add(sender)
+            sender.add_done_callback(self.senders.discard)
+
+    async def _send(self, batch: List[Tuple[bytes, asyncio.Future]]):
+        """Send one batch and resolve each caller's future with its own result."""
+        pending = [(image, future) for image, future in batch if not future.done()]
+        if not pending:
+            return
+        images = [image for image, _ in pending]
+        try:
+            prompt = MODERATION_BATCH_PROMPT.replace("{count}", str(len(images))) if len(images) > 1 else MODERATION_PROMPT
+            async with self.semaphore:
+                self.requests_sent += 1
+                results = await self.provider.moderate(prompt, images, GRID_MIME_TYPE)
+            if len(results) != len(images):
+                raise ValueError(f"Moderation returned {len(results)} results for {len(images)} images")
+            logger.info(f"Moderated {len(images)} images in one {self.provider.name} request")
+            for (_, future), result in zip(pending, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+_moderation_batchers: Dict[str, ModerationBatcher] = {}
+
+def _get_moderation_batcher(provider: LLMProvider) -> ModerationBatcher:
+    """Return the process-wide batcher for a provider."""
+    if provider.name not in _moderation_batchers:
+        _moderation_batchers[provider.name] = ModerationBatcher(
+            provider,
+            min(settings.MODERATION_BATCH_MAX_IMAGES, provider.max_moderation_images),
+            settings.MODERATION_BATCH_WINDOW_MS / 1000,
+            settings.MODERATION_CONCURRENCY,
+        )
+    return _moderation_batchers[provider.name]
+
+async def _moderate_image(idx: int, base64_image: str, semaphore: asyncio.Semaphore) -> Tuple[bool, List[str], bool]:
+    """
+    Moderate a single grid image.
+
+    Args:
+        idx (int): Position of the image, used in warnings
+        base64_image (str): Base64 encoded grid image
+        semaphore (asyncio.Semaphore): Bounds concurrent moderation calls
+
+    Returns:
+        Tuple[bool, List[str], bool]: Whether the image is safe, its warnings,
+        and whether moderation failed (the image is then treated as unsafe)
+    """
+    # Check if base64_image is valid
+    if not base64_image:
+        logger.warning(f"Image {idx} is empty. Skipping moderation.")
+        return True, [f"Image {idx} is empty. Skipping moderation."], False
+
+    try:
+        # Decode the base64 image
+        image_data = base64.b64decode(base64_image)
+    except Exception as e:
+        logger.warning(f"Error decoding base64 image {idx}: {str(e)}")
+        return True, [f"Error decoding base64 image {idx}: {str(e)}"], False
+
+    try:
+        provider = get_moderation_provider()
+        if settings.MODERATION_BATCHING:
+            moderate_grid = lambda: _get_moderation_batcher(provider).submit(image_data)
+        else:
+            async def moderate_grid():
+                async with semaphore:
+                    return (await provider.moderate(MODERATION_PROMPT, [image_data], GRID_MIME_TYPE))[0]
+
+        # Scores are cached per image under the single-image key, so both modes share entries.
+        # MODERATION_TIMEOUT_SECONDS bounds each provider request, not time queued for quota
+        result = await cached_llm_call(
+            "moderation", f"{provider.name}:{provider.moderation_model}", MODERATION_PROMPT, moderate_grid, image_data)
+        return (*_score_moderation_result(result), False)
+
+    except asyncio.TimeoutError:
+        logger.error(f"Moderation timed out for image {idx}")
+        return False, [f"Error processing image {idx}: moderation timed out"], True
+    except Exception as e:
+        logger.error(f"Error processing image {idx}: {str(e)}")
+        return False, [f"Error processing image {idx}: {str(e)}"], True
+
+async def check_content_moderation(base64_images: List[str]) -> Tuple[bool, List[str], bool]:
     """
     Ultra-strict content moderation using OpenAI's moderation API.
     Extremely conservative thresholds for all categories.
+
+    Images are moderated concurrently (at most MODERATION_CONCURRENCY at a
+    time) and their warnings are merged in image order. The third value is
+    True when moderation of any image failed rather than flagged it.
     """
     try:
         all_warnings = []
         is_safe = True
-        
-        # Ultra-strict thresholds for different categories
-        thresholds = {
-            'sexual': 0.25,            # 25%
-            'sexual/minors': 0.25,   # 25%
-            'violence': 0.25,         # 25%
-            'violence/graphic': 0.25,  # 25%
-            'harassment': 0.25,       # 25%
-            'harassment/threatening': 0.25,  # 25%
-            'hate': 0.25,            # 25%
-            'hate/threatening': 0.25,  # 25%
-            'self-harm': 0.25,        # 25%
-            'self-harm/intent': 0.25,  # 25%
-            'self-harm/instructions': 0.25,  # 25%
-            'illicit': 0.25,         # 25%
-            'illicit/violent': 0.25    # 25%
-        }
-        
-        # Process each image individually
-        for idx, base64_image in enumerate(base64_images):
-            # Check if base64_image is valid
-            if not base64_image:
-                logger.warning(f"Image {idx} is empty. Skipping moderation.")
-                all_warnings.append(f"Image {idx} is empty. Skipping moderation.")
-                continue
-            
-            try:
-                # Decode the base64 image
-                image_data = base64.b64decode(base64_image)
-            except Exception as e:
-                logger.warning(f"Error decoding base64 image {idx}: {str(e)}")
-                all_warnings.append(f"Error decoding base64 image {idx}: {str(e)}")
-                continue
-            
-            # Define the moderation prompt
-            prompt = f"""
-                Analyze this image with strict criteria to detect only explicit and definitive instances of harmful or sensitive content. Provide confidence scores ONLY if there is CLEAR and DIRECT evidence of the following categories:
-
-                - Sexual content (explicit nudity, sexual acts, etc.)
-                - Violence (physical harm, graphic violence, weapons used in harmful contexts, etc.)
-                - Harassment (direct threats, aggressive behavior, etc.)
-                - Hate speech (explicit discriminatory language targeting race, religion, gender, etc.)
-                - Self-harm (clear intent or instructions for self-harm)
-                - Illicit activities (illegal actions such as drug use, theft, or violent crimes)
-
-                DO NOT generate a "flagged" value of true unless there is definitive evidence in the image for at least one category. Avoid detecting violence or other categories in neutral or non-threatening scenarios (e.g., people walking, sports, casual interactions).
-
-                Return a JSON object with confidence scores (0.0 to 1.0) for each category AND a "flagged" boolean that is TRUE ONLY if the content violates the above criteria:
-
-                {{
-                    "sexual": float,
-                    "sexual_minors": float,
-                    "violence": float,
-                    "violence_graphic": float,
-                    "harassment": float,
-                    "harassment_threatening": float,
-                    "hate": float,
-                    "hate_threatening": float,
-                    "self_harm": float,
-                    "self_harm_intent": float,
-                    "self_harm_instructions": float,
-                    "illicit": float,
-                    "illicit_violent": float,
-                    "flagged": bool
-                }}
-
-                Only return the JSON object with the above keys and values. Do not include any additional text or explanations.
-                """
-            
-            try:
-                if omni_moderation_model:
-                    from openai import AsyncOpenAI
-                    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-                    response = await client.moderations.create(
-                        model="omni-moderation-latest",
-                        input=[{
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }]
-                    )
-                    result = response.results[0]
-                    
-                if gemini_model:
-                    # Generate response
-                    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-                    response = await client.aio.models.generate_content(
-                        model='gemini-2.0-flash',
-                        contents=[prompt, genai.types.Part.from_bytes(data=image_data, mime_type="image/png")]
-                    )
-                    
-                    # Parse the response as JSON
-                    result = json.loads(response.text.replace('```json', '').replace('```', '').strip())
-
-                # Check if content is flagged by any category
-                if result.get('flagged', False):
-                    is_safe = False
-                    all_warnings.append("SYSTEM FLAG - Content flagged by moderation system")
-
-                # Check all categories with their specific thresholds
-                for category in thresholds.keys():
-                    # Get score safely using .get() for dictionary access
-                    score = result.get(category.replace('/', '_'), 0.0)
-
-                    if not isinstance(score, (int, float)):
-                        continue
-
-                    threshold = thresholds[category]
-                    display_category = category.replace('/', ' - ').title()
-
-                    if score >= threshold:
-                        is_safe = False
-                        if score > 0.7:
-                            severity = "CRITICAL"
-                        elif score > 0.4:
-                            severity = "HIGH"
-                        elif score > 0.2:
-                            severity = "MEDIUM"
-                        else:
-                            severity = "LOW"
-                        all_warnings.append(f"{severity} RISK - {display_category} detected (confidence: {score:.1%})")
-                
-            except Exception as e:
-                logger.error(f"Error processing image {idx}: {str(e)}")
-                all_warnings.append(f"Error processing image {idx}: {str(e)}")
-                is_safe = False
+        moderation_failed = False
+
+        semaphore = asyncio.Semaphore(settings.MODERATION_CONCURRENCY)
+        results = await asyncio.gather(*[
+            _moderate_image(idx, base64_image, semaphore)
+            for idx, base64_image in enumerate(base64_images)
+        ])
+        for image_safe, image_warnings, image_failed in results:
+            is_safe = is_safe and image_safe
+            moderation_failed = moderation_failed or image_failed
+            all_warnings.extend(image_warnings)
         
         # Remove duplicates while preserving order
         seen = set()
@@ -376,125 +633,130 @@ async def check_content_moderation(base64_images: List[str]) -> Tuple[bool, List
         if is_safe:
             filtered_warnings = []  # Clear warnings if content is safe
         
-        return is_safe, filtered_warnings
+        return is_safe, filtered_warnings, moderation_failed
     
     except Exception as e:
         logger.error(f"Error in content moderation: {str(e)}")
-        return False, ["CRITICAL RISK - Error in content moderation system"]
+        return False, ["CRITICAL RISK - Error in content moderation system"], True
 
-async def analyze_grid_images(base64_images: List[str], task_id: str = None) -> List[str]:
+def _grid_dhashes(base64_grid: str) -> np.ndarray:
     """
-    Analyze grid images using GPT-4 vision model.
+    Compute a 64-bit dHash for every frame tile of a grid.
+
+    The grid is shrunk once to 9x8 pixels per tile and the tiles are split
+    out with a reshape, so all 16 hashes come from a single resize.
+
+    Args:
+        base64_grid (str): Base64 encoded grid image
+
+    Returns:
+        np.ndarray: Boolean array of shape (FRAMES_PER_GRID, 64)
     """
-    try:
-        descriptions = []
-        total_images = len(base64_images)
-        
-        for idx, base64_image in enumerate(base64_images, 1):
-            if task_id:
-                progress = 65 + (idx * 5 / total_images)
-                task_tracker.update_progress(task_id, f"Analyzing grid image {idx}/{total_images}", progress)
-            if not base64_image:
-                logger.warning(f"Image {idx} is empty. analysing grid image {idx}.")
-                continue
+    rows = FRAMES_PER_GRID // GRID_COLUMNS
+    encoded = np.frombuffer(base64.b64decode(base64_grid), dtype=np.uint8)
+    gray = cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)
+    small = cv2.resize(gray, (GRID_COLUMNS * 9, rows * 8), interpolation=cv2.INTER_AREA)
+    tiles = small.reshape(rows, 8, GRID_COLUMNS, 9).transpose(0, 2, 1, 3).reshape(FRAMES_PER_GRID, 8, 9)
+    return (tiles[:, :, 1:] > tiles[:, :, :-1]).reshape(FRAMES_PER_GRID, 64)
 
-            try:
-                # Decode the base64 image
-                image_data = base64.b64decode(base64_image)
-            except Exception as e:
-                logger.warning(f"Error decoding base64 image {idx}: {str(e)}")
-                continue
-            try:
-                if openai_model:
-                    from openai import AsyncOpenAI
-                    client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-                    response = await client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "You are a video frame analysis expert. Describe the key visual elements, actions, and details in this frame grid."
-                            },
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": "Analyze this grid of video frames. Focus on: main subjects, actions, visual elements, text overlays, scene composition, and any notable details."
-                                    },
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/png;base64,{base64_image}"
-                                        }
-                                    }
-                                ]
-                            }
-                        ],
-                        max_tokens=500
-                    )
-                    
-                    description = response.choices[0].message.content.strip()
-                if gemini_model:
-                    prompt = f'''system: You are a video frame analysis expert. Describe the key visual elements, actions, and details in this frame grid.
-                    user: Analyze this grid of video frames. Focus on: main subjects, actions, visual elements, text overlays, scene composition, and any notable details., system:'''
-                    
-                    client = genai.Client(api_key=settings.GEMINI_API_KEY)
-                    response = await client.aio.models.generate_content(model='gemini-2.0-flash',contents = [prompt, genai.types.Part.from_bytes(data=image_data, mime_type="image/png")],  config=genai.types.GenerateContentConfig(max_output_tokens= 400))
-                    result = response.text  
-                    description = result.strip()
-                
-                descriptions.append(description)
-                
-            except Exception as e:
-                logger.error(f"Error analyzing grid image {idx}: {str(e)}")
-                descriptions.append(f"Error analyzing frame grid {idx}")
-        
-        return descriptions
-        
-    except Exception as e:
-        logger.error(f"Error in grid image analysis: {str(e)}")
-        return ["Error analyzing frame grids"]
+def _dedupe_grids(base64_grids: List[str], threshold: float) -> Tuple[List[str], List[int]]:
+    """
+    Collapse visually near-identical grids.
+
+    Two grids match only when every pair of corresponding frames is within
+    threshold bits of Hamming distance between their dHashes, so a grid
+    with even one different frame (a short insert in a static shot) is
+    kept and moderated on its own. Each grid joins the first earlier
+    representative it matches.
+
+    Args:
+        base64_grids (List[str]): Base64 encoded grid images in segment order
+        threshold (float): Maximum per-frame Hamming distance (0-64)
 
-async def process_video(video_content: bytes, task_id: str) -> Tuple[bool, List[str], List[str]]:
+    Returns:
+        Tuple[List[str], List[int]]: Representative grids and, for each input grid, the index of its representative
+    """
+    hashes = [_grid_dhashes(grid) for grid in base64_grids]
+    representatives: List[int] = []
+    groups: List[int] = []
+    for idx, grid_hash in enumerate(hashes):
+        for group, rep_idx in enumerate(representatives):
+            frame_distances = np.count_nonzero(grid_hash != hashes[rep_idx], axis=1)
+            if frame_distances.max() <= threshold:
+                groups.append(group)
+                break
+        else:
+            groups.append(len(representatives))
+            representatives.append(idx)
+    return [base64_grids[idx] for idx in representatives], groups
+
+async def process_video(video_path: str, task_id: str) -> Tuple[bool, List[str], List[str], float, List[int], bool]:
     """
     Main video processing function that coordinates the entire workflow.
+
+    Near-duplicate grids are collapsed before moderation, and the returned
+    grid groups let the description stage reuse one result per group.
+
+    Args:
+        video_path (str): Path to the task's shared scratch copy of the video
+        task_id (str): Unique task identifier
+
+    Returns:
+        Tuple: is_safe, warnings, unique grids, duration in seconds, for
+        each extracted grid the index of its unique grid, and whether
+        processing or moderation failed
     """
     try:
         task_tracker.update_progress(task_id, "Starting video processing", 5)
         
         # Split video into parts
-        video_parts, duration = await split_video(video_content, task_id)
+        segments, duration = await split_video(video_path, task_id)
         task_tracker.update_progress(task_id, "Video split completed", 15)
         
         # Process each part in parallel
-        tasks = [extract_frames(part) for part in video_parts]
+        tasks = [extract_frames(video_path, segment, task_id) for segment in segments]
         base64_grids = await asyncio.gather(*tasks)
         task_tracker.update_progress(task_id, "Frame extraction completed", 25)
         
-        # Store grids in task queue
-        task_queue[task_id]['grids'] = base64_grids
+        # Record the grid count in the task queue (the grids themselves are not kept)
+        task_queue.setdefault(task_id, {})['grid_count'] = len(base64_grids)
         
         # Filter out None values and check content moderation for all grids in one call
         valid_grids = [grid for grid in base64_grids if grid is not None]
+        grid_groups = list(range(len(valid_grids)))
+        if valid_grids and settings.GRID_DEDUP_ENABLED:
+            try:
+                unique_grids, grid_groups = await run_cpu(_dedupe_grids, valid_grids, settings.GRID_DEDUP_HAMMING_THRESHOLD)
+                # Each duplicate skips one moderation and one description call
+                calls_skipped = 2 * (len(valid_grids) - len(unique_grids))
+                logger.info(f"Grid deduplication: {len(valid_grids)} grids, {len(unique_grids)} unique, {calls_skipped} calls skipped")
+                task_tracker.record_metric(task_id, "grid_dedup", {
+                    "grids": len(valid_grids),
+                    "unique_grids": len(unique_grids),
+                    "calls_skipped": calls_skipped,
+                })
+                valid_grids = unique_grids
+            except Exception as e:
+                logger.warning(f"Grid deduplication failed, using all grids: {str(e)}")
+                grid_groups = list(range(len(valid_grids)))
+
         if valid_grids:
             task_tracker.update_progress(task_id, "Starting content moderation", 30)
-            is_safe, warnings = await check_content_moderation(valid_grids)
+            is_safe, warnings, moderation_failed = await check_content_moderation(valid_grids)
             task_tracker.update_progress(task_id, "Content moderation completed", 35)
         else:
-            is_safe, warnings = False, ["No valid frames extracted"]
+            is_safe, warnings, moderation_failed = False, ["No valid frames extracted"], False
             valid_grids = []
         
         print(f"\n{'='*30}\nIs Safe: {is_safe}\n{'='*30}")
         print(f"\n{'='*30}\nWarnings: {warnings}\n{'='*30}")
         
         # Store results in task queue
-        task_queue[task_id]['is_safe'] = is_safe
-        task_queue[task_id]['warnings'] = warnings
+        task_queue.setdefault(task_id, {}).update(is_safe=is_safe, warnings=warnings)
         
-        return is_safe, warnings, valid_grids, duration
+        return is_safe, warnings, valid_grids, duration, grid_groups, moderation_failed
     
     except Exception as e:
         logger.error(f"Error in video processing: {str(e)}")
-        task_queue[task_id]['error'] = str(e)
-        return False, [f"Processing error: {str(e)}"], []
\ No newline at end of file
+        task_queue.setdefault(task_id, {})['error'] = str(e)
+        return False, [f"Processing error: {str(e)}"], [], None, [], True
\ No newline at end of file
@@ -1,11 +1,18 @@
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import os
 
 from app.api.routes import video_analysis
 from app.core.config import settings
 from app.core.logging import setup_logging
+from app.core.scratch import run_scratch_janitor
+from app.core.executors import shutdown_executors
+from app.core.task_tracker import task_tracker
+from app.core.job_queue import job_queue
+from app.core.downloader import close_download_client
+from app.services.llm_provider import close_providers
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -22,6 +29,18 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     setup_logging()
+    job_queue.start()
+    asyncio.create_task(run_scratch_janitor())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Jobs still waiting are lost with this worker; record them as failed for every worker to see
+    for task_id in await job_queue.stop():
+        task_tracker.complete_task(task_id, "error")
+    await close_providers()
+    await close_download_client()
+    shutdown_executors()
+    task_tracker.close()
 
 # Serve your HTML file on "/"
 @app.get("/", include_in_schema=False)
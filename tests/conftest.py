@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# Settings are read when app modules are imported, so point them at the offline
+# provider and a throwaway data directory before any test imports the app
+_data_dir = tempfile.mkdtemp(prefix="video-analysis-tests-")
+
+os.environ.setdefault("openai_model", "false")
+os.environ.setdefault("gemini_model", "false")
+os.environ.setdefault("omni_moderation_model", "false")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+os.environ.setdefault("TASK_STORE_BACKEND", "sqlite")
+os.environ.setdefault("TASK_STORE_FILE", os.path.join(_data_dir, "tasks.db"))
+os.environ.setdefault("RESULT_ARCHIVE_FILE", os.path.join(_data_dir, "results_archive.db"))
+os.environ.setdefault("RESULT_CACHE_FILE", os.path.join(_data_dir, "result_cache.db"))
+os.environ.setdefault("LLM_CACHE_FILE", os.path.join(_data_dir, "llm_cache.db"))
+os.environ.setdefault("SCRATCH_DIR", os.path.join(_data_dir, "scratch"))
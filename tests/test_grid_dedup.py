@@ -0,0 +1,36 @@
+import base64
+
+import cv2
+import numpy as np
+
+from app.services.video_processor import FRAMES_PER_GRID, _build_grid, _dedupe_grids
+
+
+def _frame(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (72, 128, 3), dtype=np.uint8)
+
+
+def _encode(frames) -> str:
+    ok, encoded = cv2.imencode(".png", _build_grid(frames, 128, 72))
+    assert ok
+    return base64.b64encode(encoded.tobytes()).decode()
+
+
+def test_identical_grids_are_merged():
+    static = [_frame(0)] * FRAMES_PER_GRID
+
+    unique, groups = _dedupe_grids([_encode(static), _encode(static)], 5.0)
+
+    assert len(unique) == 1
+    assert groups == [0, 0]
+
+
+def test_grid_with_one_different_frame_stays_separate():
+    static = [_frame(0)] * FRAMES_PER_GRID
+    with_insert = list(static)
+    with_insert[5] = _frame(1)
+
+    unique, groups = _dedupe_grids([_encode(static), _encode(with_insert)], 5.0)
+
+    assert len(unique) == 2
+    assert groups == [0, 1]
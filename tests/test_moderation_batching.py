@@ -0,0 +1,36 @@
+import asyncio
+import base64
+
+from app.core.config import settings
+from app.services import video_processor
+from app.services.llm_provider import FakeProvider
+from app.services.video_processor import ModerationBatcher, check_content_moderation
+
+
+def test_batcher_packs_several_images_into_one_request():
+    async def run():
+        batcher = ModerationBatcher(FakeProvider(), max_images=8, window_seconds=0.05, concurrency=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(*[batcher.submit(f"image {i}".encode()) for i in range(3)]),
+            timeout=5,
+        )
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+
+    assert batcher.requests_sent == 1
+    assert len(results) == 3
+    assert all(result["flagged"] is False for result in results)
+
+
+def test_batched_moderation_marks_clean_grids_safe(monkeypatch):
+    monkeypatch.setattr(settings, "MODERATION_BATCHING", True)
+    monkeypatch.setattr(settings, "MODERATION_TIMEOUT_SECONDS", 5.0)
+    monkeypatch.setattr(video_processor, "_moderation_batchers", {})
+    grids = [base64.b64encode(f"grid {i}".encode()).decode() for i in range(3)]
+
+    is_safe, warnings, moderation_failed = asyncio.run(check_content_moderation(grids))
+
+    assert is_safe
+    assert warnings == []
+    assert not moderation_failed